@@ -1,6 +1,10 @@
+import sys
+import numpy as np
 import geopandas as gpd
-from shapely.geometry import Polygon, Point
-import os
+# Shared modules in ../pygis
+sys.path.append('..')
+from pygis.polygons import polygons_from_arrays
+from pygis.output import write_layer
 
 # X -coordinates 
 xcoords = [29.99671173095703, 31.58196258544922, 27.738052368164062, 26.50013542175293, 26.652359008789062, 25.921663284301758, 22.90027618408203, 23.257217407226562,
@@ -23,16 +27,16 @@ ycoords = [63.748023986816406, 62.90789794921875, 60.511383056640625, 60.4449958
 # ------------------------------------------------------------------------
 # Coordinate pair can be either a tuple or a list.
 # The first coordinate pair in the 'coordpairs' -list should look like: (29.99671173095703, 63.748023986816406)
-# Hint: you might want to iterate over items in the lists using a for-loop
+# The pairs are kept as one (n, 2) array rather than a list of shapely Points
 
-coordpairs = []
-for x, y in zip(xcoords, ycoords):
-  coordpairs.append(Point(x, y))
+coordpairs = np.column_stack([xcoords, ycoords])
 
 
 # P2. Create a shapely Polygon using the 'coordpairs' -list
 # ------------------------------------------------------------------------
-poly = Polygon([[p.x, p.y] for p in coordpairs])
+# Flat coordinates plus ring offsets (GeoArrow layout): one ring with all 
+# the vertices. Many rings/polygons are built in the same call
+poly = polygons_from_arrays(coordpairs, ring_offsets=[0, len(coordpairs)])[0]
 
 # P3. Create an empty GeoDataFrame
 # ---------------------------------
@@ -43,15 +47,14 @@ geo = gpd.GeoDataFrame()
 # Hint: Take advantage of .loc -funtion
 geo = geo.set_geometry([poly])
 
-# P5. Save the GeoDataFrame into a new Shapefile called 'polygon.shp'
-# --------------------------------------------------------------------
+# P5. Save the GeoDataFrame into a new GeoPackage called 'geo_poly.gpkg'
+# -----------------------------------------------------------------------
 # Note: you do not need to define the coordinate reference system at this time
 # Set the GeoDataFrame's coordinate system to WGS84
 geo.set_crs('epsg:4326', inplace=True)
-if not os.path.exists('./results'):
-    os.mkdir('./results')
-outfp = r"./results/geo_poly.shp"
-geo.to_file(outfp)
+# The ./results directory is created if needed
+outfp = r"./results/geo_poly.gpkg"
+write_layer(geo, outfp)
 
 # P6. Plot the polygon using taking advantage of the .plot() -function in GeoDataFrame. Save a PNG figure out of your plot and upload it to your GitHub repository.
 # -----------------------------------------------------------------------------------------------------------------------------------------------------------------
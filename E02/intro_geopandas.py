@@ -7,8 +7,11 @@ Read and Write shapefiles
 
 import geopandas as gpd
 from shapely.geometry import Polygon
+import sys
 import zipfile
-import os
+# Shared modules in ../pygis
+sys.path.append('..')
+from pygis.output import write_layer
 
 # Unzip data
 data_filepath = '../data/damselfish_distributions.zip'
@@ -72,8 +75,6 @@ print(newdata.crs)
 newdata.set_crs('epsg:4326', inplace=True)
 # Let's see how the crs definition looks like
 newdata.crs
-# Write the data into that Shapefile
-if not os.path.exists('./results'):
-    os.mkdir('./results')
-outfp = r"./results/helsinki_senate.shp"
-newdata.to_file(outfp)
+# Write the data into a GeoPackage
+outfp = r"./results/helsinki_senate.gpkg"
+write_layer(newdata, outfp)
@@ -3,63 +3,55 @@
 """
 Task 1: Points to map
 Task 2: How long distance individuals have travelled?
+Task 3: Posts in an area between two dates
 """
 
-import csv
+import sys
 import geopandas as gpd
-from shapely.geometry import Point, LineString
+from shapely.geometry import LineString
+# Shared modules in ../pygis
+sys.path.append('..')
+from pygis.distance import distance
+from pygis.post_index import open_index, parse_times
+from pygis.trajectory import trajectory_stats
+from pygis.output import write_layer
+from pygis.points import read_points_csv
 
 # Task 1: Points to map 
-# Read file as CSV
-items = []
-points = []
-
 # The data has 81379 rows and consists of locations and times of 
 # social media posts inside Kruger national park in South Africa
 # Data is in epsg(4326)
 
-with open('../data/southafrica_posts.csv') as fin:
-    reader = csv.reader(fin, skipinitialspace=True, delimiter=',')
-    headers = next(reader)
-    for row in reader:
-        item={}
-        for ix, element in enumerate(row):
-            item[headers[ix]] = element
-        item['coords'] = Point(float(item['lon']), float(item['lat']))
-        points.append(item['coords'])
-        items.append(item)
+# Read file as CSV into a point layer: coordinates are kept as int32 arrays
+# with a resolution of 1e-7 deg (~1 cm) rather than one shapely Point per post
+posts = read_points_csv('../data/southafrica_posts.csv', x='lon', y='lat', crs=4326,
+                        resolution=1e-7)
 
 # Limit to 20% of data
-items = items[0 : len(items) // 5]
-
-# Create GeoDataFrame from dictionary
-geodf = gpd.GeoDataFrame(items)
+posts = posts[0 : len(posts) // 5]
 
-# Rename coords as geometry
-geodf = geodf.rename(columns={'coords':'geometry'})
-geodf.set_geometry(col='geometry', inplace=True)
-
-# Add CRS
-geodf.set_crs('epsg:4326', inplace=True)
+# Create GeoDataFrame, shapely Points are only created here for plotting and saving
+geodf = posts.to_geodataframe()
+geodf['lon'] = posts.x
+geodf['lat'] = posts.y
 
 # Plot
 ax = geodf.plot()
 ax.set_xlabel('deg')
 ax.set_ylabel('deg')
 
-# Save shapely
-outfp = r"./results/geo_poly.shp"
-geodf.to_file(outfp)
+# Save posts, GeoPackage is written in batches rather than feature by feature
+outfp = r"./results/posts.gpkg"
+write_layer(geodf, outfp)
 
 # Task 2: How long distance individuals have travelled? 
-# Data is projected to EPSG:32735 projection which stands for 
-# UTM Zone 35S (UTM zone for South Africa) to transform the data into 
-# metric system.
+# Distances are computed on the WGS84 ellipsoid from the lon/lat of the 
+# posts, there is no need to project the data to EPSG:32735 
+# (UTM Zone 35S, UTM zone for South Africa) to have them in meters.
 
 # List of unique users
 users = geodf['userid'].unique()
 
-# Project to EPSG:32735
 geo_sa = geodf.copy()
 
 # Define index
@@ -82,6 +74,10 @@ for user in users:
         trip['userid'] = user
         trip['timestamp_ini'] = geo_sa_user.iloc[ix_trip]['timestamp']
         trip['timestamp_fin'] = geo_sa_user.iloc[ix_trip+1]['timestamp']
+        trip['lon_ini'] = float(geo_sa_user.iloc[ix_trip]['lon'])
+        trip['lat_ini'] = float(geo_sa_user.iloc[ix_trip]['lat'])
+        trip['lon_fin'] = float(geo_sa_user.iloc[ix_trip+1]['lon'])
+        trip['lat_fin'] = float(geo_sa_user.iloc[ix_trip+1]['lat'])
         trip['geometry'] = LineString([geo_sa_user.iloc[ix_trip]['geometry'], 
                                        geo_sa_user.iloc[ix_trip+1]['geometry']])
         trips.append(trip)
@@ -89,8 +85,10 @@ for user in users:
 movs = gpd.GeoDataFrame(trips)
 # Add CRS
 movs.set_crs('epsg:4326', inplace=True)
-movs = movs.to_crs(epsg=32735)
-movs['distance'] = movs['geometry'].length
+# Geodesic distance for the whole columns (method='haversine' is faster)
+movs['distance'] = distance(movs['lon_ini'].to_numpy(), movs['lat_ini'].to_numpy(),
+                            movs['lon_fin'].to_numpy(), movs['lat_fin'].to_numpy(),
+                            method='geodesic')
 
 # What was the shortest distance travelled (between two posts) in meters?
 print('Shortest distance travelled (between two posts) was {0} meters'.format(
@@ -101,7 +99,23 @@ print('Mean distance travelled (between two posts) was {0} meters'.format(
 # What was the maximum distance travelled (between two posts) in meters?
 print('Maximum distance travelled (between two posts) was {0} meters'.format(
     movs['distance'].max()))
+# Statistics per user: total distance, max speed, dwell time, radius of gyration
+# computed in parallel with shards of users (trajectory_stats_csv for large files)
+stats = trajectory_stats(geodf['lon'].astype(float), geodf['lat'].astype(float),
+                         parse_times(geodf['timestamp']), geodf['userid'].astype(int))
+print('Users with the longest total distance travelled')
+print(stats.sort_values(by='total_distance', ascending=False).head())
 # Plot all trips
 ax = movs.plot()
-ax.set_xlabel('m')
-ax.set_ylabel('m')
\ No newline at end of file
+ax.set_xlabel('deg')
+ax.set_ylabel('deg')
+
+# Task 3: Posts in an area between two dates
+# The index is saved in ../data/southafrica_posts.csv.idx and it is built 
+# only the first time. Queries read only the matching rows from disk
+posts_index = open_index('../data/southafrica_posts.csv')
+# Posts around Skukuza in July 2015
+posts = posts_index.query(bbox=(31.4, -25.1, 31.7, -24.8), 
+                          start='2015-07-01', end='2015-08-01')
+print('{0} posts around Skukuza in July 2015, from {1} users'.format(
+    len(posts), posts['userid'].nunique()))
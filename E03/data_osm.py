@@ -5,8 +5,12 @@ Data from OpenStreetMap using the OSMnx package
 More examples of OSMnx in https://github.com/gboeing/osmnx
 """
 
+import sys
 import osmnx as ox
 import matplotlib.pyplot as plt
+# Shared modules in ../pygis
+sys.path.append('..')
+from pygis.street_network import StreetNetwork
 
 place_name = "Kamppi, Helsinki, Finland"
 graph = ox.graph_from_place(place_name)
@@ -22,16 +26,19 @@ fig, ax = ox.plot_graph(graph, node_color='#0000FF', edge_color='#FF0000')
 area = ox.geocode_to_gdf(place_name)                            
 # Parks as GDF
 parks = ox.geometries_from_place(place_name, tags={'leisure':'park'}) 
-# Nodes and edges as GDF
-nodes, edges = ox.graph_to_gdfs(graph)            
+# Nodes and edges as arrays, 'highway' as categorical codes
+# (lighter than ox.graph_to_gdfs(graph) for city-wide graphs)
+network = StreetNetwork.from_graph(graph, attributes=['highway'])
 
 # plotting data
 fig, ax = plt.subplots()
 area.plot(ax=ax, facecolor='#000000')
-edges.plot(ax=ax, linewidth=1, edgecolor='#AAAAAA')
-nodes.plot(ax=ax, linewidth=1, edgecolor='#0000FF')
+# One LineCollection per 'highway' category, footways in red
+network.plot_edges(ax, attribute='highway',
+                   styles={'footway': {'linewidth': 1, 'color': '#FF0000', 'zorder': 4}},
+                   default={'linewidth': 1, 'color': '#AAAAAA', 'zorder': 2})
+network.plot_nodes(ax, s=3, color='#0000FF', zorder=3)
 parks.plot(ax=ax, facecolor='#00FF00', alpha=0.7)
-edges[edges['highway']=='footway'].plot(ax=ax, linewidth=1, edgecolor='#FF0000')
 plt.axis('on')
 plt.title('Data from Kamppi, Helsinki, Finland.  (OpenStreetMap)')
 ax.set_xlabel('longitude (deg)')
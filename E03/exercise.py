@@ -5,12 +5,16 @@ Exercise for Lecture 3:
 https://github.com/AutoGIS-2017/Exercise-3
 """
 
-import zipfile
+import sys
 import csv
+import pandas as pd
 import geopandas as gpd
 import contextily as cx
-import os
 from matplotlib_scalebar.scalebar import ScaleBar
+# Shared modules in ../pygis
+sys.path.append('..')
+from pygis.output import write_layer
+from pygis.population import open_surface
 
 
 # Problem 1 Geocode shopping centers 
@@ -40,12 +44,9 @@ data_gdf = data_gdf.join(geo_xy['geometry'])
 data_gdf.to_crs(epsg=4326)
 # Project to EPSG 3035
 data_gdf = data_gdf.to_crs(epsg=3035)
-# Write the data into that Shapefile
-# Export the geometries to a shapefile
-if not os.path.exists('./results'):
-    os.mkdir('./results')
-outfp = r"./results/shopping_centers.shp"
-data_gdf.to_file(outfp)
+# Export the geometries to a GeoPackage
+outfp = r"./results/shopping_centers.gpkg"
+write_layer(data_gdf, outfp)
 
 # Problem 2 Create buffers around shopping centers
 data_gdf_point = data_gdf.copy()
@@ -57,28 +58,20 @@ data_gdf['geometry'] = data_gdf['buffer']
 # see: https://automating-gis-processes.github.io/2016/Lesson3-spatial-join.html#download-and-clean-the-data
 # for information on Spatial Join
 
-# Unzip data
-data_filepath = '../data/Vaestotietoruudukko_2015.zip'
-with zipfile.ZipFile(data_filepath,'r') as zip_ref:
-    zip_ref.extractall(data_filepath[:-4])
-
-# Load data from population in Helsinki
-pop = gpd.read_file(data_filepath[:-4] +  '/Vaestotietoruudukko_2015.shp')
+# Population grid as a surface of cell centroids, split in 10-km tiles on disk.
+# It is built once from the zip file, reading it in chunks. Queries only read 
+# the tiles near the shopping centers
 # Column ASUKKAITA (population in Finnish), inhabitants in a polygon
-pop = pop.rename(columns={'ASUKKAITA': 'population'})
-pop = pop[['population', 'geometry']]
-# Change to same CRS
-pop = pop.to_crs(epsg=3035)
-if not pop.crs == data_gdf.crs:
-    print('Not the same CRS')
-
-# Find if one population poligon is inside a 5-km radius of the shopping centers
-# This joins the GDF using the geometry columns
-# Keeps the geometries in 'pop', that are 'within' the geometries in data_gdf
-# 'inner' says that it will keep the columns of both GDF
-join = gpd.sjoin(pop, data_gdf, how="inner", op="within")
-# Perform summation per column 'name' of shopping center
-sum_mall = join.groupby(['name']).sum()['population']
+pop = open_surface('zip://../data/Vaestotietoruudukko_2015.zip', 
+                   '../data/Vaestotietoruudukko_2015_tiles', crs=3035, column='ASUKKAITA')
+
+# Population in the cells that are 'within' the 5-km buffers of the shopping centers
+# (same cells as gpd.sjoin(pop, data_gdf, predicate='within'), the cells near the
+# edge of the buffers are tested with their polygons)
+population = pop.sum_within_radius(data_gdf_point.geometry.x, data_gdf_point.geometry.y, 
+                                   5000, cells='within')
+sum_mall = pd.Series(population, index=data_gdf_point['name'], name='population')
+sum_mall = sum_mall[sum_mall > 0]
 print('Malls ranked according the largest population in a 5-km radious')
 print(sum_mall.sort_values(ascending=False))
 
@@ -7,7 +7,10 @@ Geocoding: converting addresses into coordinates
 import pandas as pd
 from geopandas.tools import geocode
 from matplotlib import pyplot as plt
-import os
+import sys
+# Shared modules in ../pygis
+sys.path.append('..')
+from pygis.output import write_layer
 
 # File with addresses
 filepath = r'../data/helsinki_addresses.txt'
@@ -24,11 +27,9 @@ geo.loc[0]
 # Join 'id' from data to geo 
 join = geo.join(data['id'])
 
-# Export the geometries to a shapefile
-if not os.path.exists('./results'):
-    os.mkdir('./results')
-filepath_shp = r"./results/addresses.shp"
-join.to_file(filepath_shp)
+# Export the geometries to a GeoPackage
+filepath_gpkg = r"./results/addresses.gpkg"
+write_layer(join, filepath_gpkg)
 
 # Plot of the location of the addresses
 join.plot()
@@ -4,11 +4,16 @@
 Reclassification
 """
 
+import sys
+import glob
 import zipfile
 import geopandas as gpd
 from shapely.geometry import Polygon
 import contextily as cx
 from matplotlib_scalebar.scalebar import ScaleBar
+# Shared modules in ../pygis
+sys.path.append('..')
+from pygis.travel_matrix import open_matrix
 
 # Unzip data
 data_filepath = '../data/helsinki_region_travel_time_2015.zip'
@@ -42,6 +47,13 @@ print('Longitude {0:.2f} deg, Latitude {1:.2f} deg'.format(centroid.to_crs(4326)
 # (Museum of Finnish and international art)
 # Kaivokatu 2, 00100 Helsinki, Finland
 
+# Travel times between any pair of cells: all the TravelTimes_to_*.shp files
+# are packed once in a memory-mapped matrix, later runs only open it
+shp_files = sorted(glob.glob(data_filepath[:-4] + '/data/TravelTimes_to_*.shp'))
+matrix = open_matrix(shp_files, data_filepath[:-4] + '/pt_r_tt.matrix', value='pt_r_tt')
+print('Cells within 15 min of the station by public transportation: {}'.format(
+      len(matrix.within(5975375, 15))))
+
 # The NoData values are presented with value -1
 # Keep only valid data
 # pt_r_tt Public transportation travel time, including time before starting the travel (minutes)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the core stages of the gallery pipelines
+
+For each stage and scale:
+ 1. The synthetic inputs are generated once and cached in the work directory,
+    again when stages.py or the generators change
+ 2. The stage runs in a new process, so its peak RSS is not mixed with
+    other stages, and wall time, CPU time, throughput and peak RSS are reported
+ 3. A run that raises, is killed (e.g. out of memory) or exceeds --timeout is
+    reported as failed and the other stages go on
+Results are saved as JSON, and can be compared with a previous run:
+
+$ python run_benchmarks.py --scales 1 10 --output ./results/today.json
+$ python run_benchmarks.py --scales 1 10 --compare ./results/today.json
+"""
+
+import os
+import sys
+import gc
+import json
+import time
+import pickle
+import argparse
+import traceback
+import platform
+import resource
+import subprocess
+import multiprocessing as mp
+import queue as queue_module
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+# Shared modules in ../pygis
+sys.path.append(os.path.join(BENCH_DIR, '..'))
+
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+# Files that generate the cached inputs
+INPUT_SOURCES = ['stages.py', 'synthetic.py', 'stand_ins.py']
+
+
+def _rss_mb(maxrss):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+def _current_rss_mb():
+    try:
+        with open('/proc/self/statm') as fin:
+            pages = int(fin.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError):
+        return _rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+def _prepare(stage, scale, workdir, path):
+    # Child process: generate the inputs of the stage and cache them
+    from stages import STAGES
+    inputs = STAGES[stage][0](scale, workdir)
+    with open(path, 'wb') as fout:
+        pickle.dump(inputs, fout, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _measure(stage, path, queue):
+    # Child process: run the stage once on the cached inputs
+    try:
+        from stages import STAGES
+        with open(path, 'rb') as fin:
+            inputs = pickle.load(fin)
+        gc.collect()
+        rss_before = _current_rss_mb()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        items = STAGES[stage][1](**inputs)
+        cpu = time.process_time() - cpu
+        wall = time.perf_counter() - wall
+        peak = _rss_mb(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+        queue.put({'items': int(items), 'wall_time': wall, 'cpu_time': cpu,
+                   'rss_before_mb': rss_before, 'peak_rss_mb': peak})
+    except Exception:
+        queue.put({'error': traceback.format_exc()})
+
+
+def _in_child(target, *args):
+    ctx = mp.get_context('spawn')
+    process = ctx.Process(target=target, args=args)
+    process.start()
+    process.join()
+    if process.exitcode != 0:
+        raise RuntimeError('{} failed with exit code {}'.format(args[0], process.exitcode))
+
+
+def _wait_result(process, queue, timeout):
+    # Result of a _measure child, or an error if it died or timed out
+    start = time.monotonic()
+    while True:
+        try:
+            return queue.get(timeout=1)
+        except queue_module.Empty:
+            pass
+        if not process.is_alive():
+            # Killed by the OOM killer or a signal, without a result
+            try:
+                return queue.get(timeout=1)
+            except queue_module.Empty:
+                return {'error': 'process exited with code {}'.format(process.exitcode)}
+        if timeout is not None and time.monotonic() - start > timeout:
+            process.kill()
+            return {'error': 'timed out after {} s'.format(timeout)}
+
+
+def run_case(stage, scale, workdir, repeat=1, timeout=None):
+    """
+    Result dict for one stage and scale, best wall time over 'repeat' runs.
+    If the stage fails, is killed or runs longer than 'timeout' seconds the
+    dict has an 'error' instead of the measurements
+    """
+    path = os.path.join(workdir, '{}_{}.pkl'.format(stage, scale))
+    # Inputs are generated again when the stages or the generators change
+    inputs_mtime = max(os.path.getmtime(os.path.join(BENCH_DIR, name)) for name in INPUT_SOURCES)
+    failed = {'stage': stage, 'scale': scale, 'repeat': repeat}
+    if not os.path.exists(path) or os.path.getmtime(path) < inputs_mtime:
+        try:
+            _in_child(_prepare, stage, scale, workdir, path)
+        except RuntimeError as error:
+            return dict(failed, error='preparing the inputs: {}'.format(error))
+    ctx = mp.get_context('spawn')
+    runs = []
+    for _ in range(repeat):
+        queue = ctx.Queue()
+        process = ctx.Process(target=_measure, args=(stage, path, queue))
+        process.start()
+        result = _wait_result(process, queue, timeout)
+        process.join()
+        if 'error' in result:
+            return dict(failed, error=result['error'])
+        runs.append(result)
+    best = min(runs, key=lambda r: r['wall_time'])
+    best['peak_rss_mb'] = max(r['peak_rss_mb'] for r in runs)
+    best['throughput'] = best['items'] / best['wall_time'] if best['wall_time'] > 0 else None
+    best.update({'stage': stage, 'scale': scale, 'repeat': repeat})
+    return best
+
+
+def _git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BENCH_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(results, baseline=None, threshold=1.10):
+    header = '{:<18} {:>6} {:>12} {:>10} {:>10} {:>14} {:>10}'.format(
+        'stage', 'scale', 'items', 'wall (s)', 'cpu (s)', 'items/s', 'peak MB')
+    if baseline is not None:
+        header += ' {:>10}'.format('vs base')
+    print(header)
+    print('-' * len(header))
+    base = {}
+    if baseline is not None:
+        base = {(r['stage'], r['scale']): r for r in baseline['results']}
+    for r in results:
+        if 'error' in r:
+            print('{:<18} {:>6} FAILED: {}'.format(r['stage'], r['scale'],
+                                                   r['error'].strip().split('\n')[-1]))
+            continue
+        line = '{:<18} {:>6} {:>12} {:>10.3f} {:>10.3f} {:>14.1f} {:>10.1f}'.format(
+            r['stage'], r['scale'], r['items'], r['wall_time'], r['cpu_time'],
+            r['throughput'] or 0, r['peak_rss_mb'])
+        if baseline is not None:
+            old = base.get((r['stage'], r['scale']))
+            if old is None or 'error' in old:
+                line += ' {:>10}'.format('-')
+            else:
+                ratio = r['wall_time'] / old['wall_time']
+                flag = ' REGRESSION' if ratio > threshold else ''
+                line += ' {:>9.2f}x{}'.format(ratio, flag)
+        print(line)
+
+
+def main(argv=None):
+    from stages import STAGES
+
+    parser = argparse.ArgumentParser(description='Benchmarks of the gallery pipeline stages')
+    parser.add_argument('--stages', nargs='+', default=list(STAGES), choices=list(STAGES))
+    parser.add_argument('--scales', nargs='+', type=int, default=[1, 10],
+                        help='data size relative to the bundled files (1 to 1000)')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--workdir', default=os.path.join(BENCH_DIR, 'work'),
+                        help='directory for the cached synthetic inputs')
+    parser.add_argument('--output', default=None, help='JSON file for the results')
+    parser.add_argument('--compare', default=None, help='JSON file of a previous run')
+    parser.add_argument('--threshold', type=float, default=1.10,
+                        help='wall time ratio reported as a regression')
+    parser.add_argument('--timeout', type=float, default=None,
+                        help='seconds after which a run is stopped and reported as failed')
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    results = []
+    for stage in args.stages:
+        for scale in args.scales:
+            print('Running {} at scale {}'.format(stage, scale), flush=True)
+            result = run_case(stage, scale, args.workdir, repeat=args.repeat,
+                              timeout=args.timeout)
+            if 'error' in result:
+                print(result['error'], file=sys.stderr)
+            results.append(result)
+
+    report = {'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'git_revision': _git_revision(),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'cpu_count': os.cpu_count(),
+              'results': results}
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare) as fin:
+            baseline = json.load(fin)
+    print_table(results, baseline, args.threshold)
+
+    output = args.output
+    if output is None:
+        output = os.path.join(RESULTS_DIR, 'bench_{}.json'.format(time.strftime('%Y%m%d_%H%M%S')))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as fout:
+        json.dump(report, fout, indent=2)
+    print('Results saved in ' + output)
+    return 1 if any('error' in r for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Core stages of the gallery pipelines, as functions for the benchmarks
+
+Each stage has:
+ prepare(scale, workdir) -> dict with the inputs (synthetic data)
+ run(**inputs)           -> number of items processed
+Only run() is timed. The stages follow the computations in the scripts,
+with the network services replaced by the stand-ins.
+"""
+
+import os
+import sys
+import csv
+import subprocess
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import Point, LineString
+
+import synthetic
+import stand_ins
+from pygis.distance import distance
+from pygis.post_index import parse_times
+from pygis.population import build_surface, PopulationSurface
+from pygis.travel_matrix import build_matrix, TravelMatrix
+from pygis.points import read_points_csv
+from pygis import accessibility
+
+
+# E01/file_coords_to_geom.py: read the CSV and compute distances
+def prepare_e01_ingest(scale, workdir):
+    path = os.path.join(workdir, 'travel_times_{}.txt'.format(scale))
+    return {'path': synthetic.travel_times(scale, path)}
+
+
+def run_e01_ingest(path):
+    items = pd.read_csv(path, sep=';', usecols=['from_x', 'from_y', 'to_x', 'to_y'],
+                        dtype=np.float64)
+    distances = distance(items['from_x'].to_numpy(), items['from_y'].to_numpy(),
+                         items['to_x'].to_numpy(), items['to_y'].to_numpy())
+    np.mean(distances)
+    return len(items)
+
+
+# E02/southafrica.py Task 1: read the CSV as dicts with Points
+def prepare_e02_ingest(scale, workdir):
+    path = os.path.join(workdir, 'posts_{}.csv'.format(scale))
+    return {'path': synthetic.posts(scale, path)}
+
+
+def run_e02_ingest(path):
+    items = []
+    with open(path) as fin:
+        reader = csv.reader(fin, skipinitialspace=True, delimiter=',')
+        headers = next(reader)
+        for row in reader:
+            item = dict(zip(headers, row))
+            item['geometry'] = Point(float(item['lon']), float(item['lat']))
+            items.append(item)
+    geodf = gpd.GeoDataFrame(items, crs=4326)
+    return len(geodf)
+
+
+# E02/southafrica.py Task 1: read the CSV into a quantized point layer
+def prepare_e02_ingest_points(scale, workdir):
+    path = os.path.join(workdir, 'posts_{}.csv'.format(scale))
+    if not os.path.exists(path):
+        synthetic.posts(scale, path)
+    return {'path': path}
+
+
+def run_e02_ingest_points(path):
+    posts = read_points_csv(path, x='lon', y='lat', crs=4326, resolution=1e-7)
+    return len(posts)
+
+
+# E02/southafrica.py Task 2: trips between consecutive posts of each user
+def prepare_trajectories(scale, workdir):
+    path = os.path.join(workdir, 'posts_{}.csv'.format(scale))
+    if not os.path.exists(path):
+        synthetic.posts(scale, path)
+    return {'posts': pd.read_csv(path)}
+
+
+def run_trajectories(posts):
+    posts = posts.assign(time=parse_times(posts['timestamp']))
+    posts = posts.sort_values(by=['userid', 'time'], kind='stable')
+    lon = posts['lon'].to_numpy()
+    lat = posts['lat'].to_numpy()
+    userid = posts['userid'].to_numpy()
+    same = np.flatnonzero(userid[1:] == userid[:-1])
+    trips = [LineString([(lon[i], lat[i]), (lon[i + 1], lat[i + 1])]) for i in same]
+    movs = gpd.GeoDataFrame({'userid': userid[same]}, geometry=trips, crs=4326)
+    movs['distance'] = distance(lon[same], lat[same], lon[same + 1], lat[same + 1])
+    return len(movs)
+
+
+# E03/reclassification.py: filter the travel times and classify each row
+def prepare_reclassification(scale, workdir):
+    return {'acc': synthetic.ykr_travel_times(scale)}
+
+
+def custom_classifier(row, col1, col2, thr1, thr2, col_out):
+    if row[col1] < thr1 and row[col2] > thr2:
+        row[col_out] = 'Yes'
+    else:
+        row[col_out] = 'No'
+    return row
+
+
+def run_reclassification(acc):
+    acc['walk_d_km'] = acc['walk_d'] / 1000
+    acc = acc[(acc['pt_r_tt'] >= 0) & (acc['walk_d_km'] >= 0)]
+    acc = acc.apply(custom_classifier, col1='pt_r_tt', col2='walk_d_km', thr1=35, thr2=5,
+                    col_out='custom_classifier', axis=1)
+    return len(acc)
+
+
+# E03/exercise.py: population within 5 km of the shopping centers
+def prepare_spatial_join(scale, workdir):
+    pop = synthetic.population_grid(scale)
+    malls = synthetic.shopping_centers(scale)
+    # Geocode malls inside the extent of the population grid
+    bbox = tuple(pop.to_crs(epsg=4326).total_bounds)
+    geo_xy = stand_ins.geocode(malls['address'], bbox=bbox)
+    malls = gpd.GeoDataFrame(malls.join(geo_xy['geometry']), crs=4326)
+    return {'pop': pop, 'malls': malls}
+
+
+def run_spatial_join(pop, malls):
+    malls = malls.to_crs(epsg=3035)
+    malls['geometry'] = malls['geometry'].buffer(5000)
+    pop = pop.to_crs(epsg=3035)
+    join = gpd.sjoin(pop, malls, how='inner', predicate='within')
+    join.groupby(['name'])['population'].sum()
+    return len(pop)
+
+
+# E03/exercise.py: same query over the tiled population surface
+def prepare_population_surface(scale, workdir):
+    inputs = prepare_spatial_join(scale, workdir)
+    surface_dir = os.path.join(workdir, 'population_surface_{}'.format(scale))
+    build_surface(inputs['pop'], surface_dir, crs=3035)
+    return {'surface_dir': surface_dir, 'malls': inputs['malls']}
+
+
+def run_population_surface(surface_dir, malls):
+    surface = PopulationSurface(surface_dir)
+    malls = malls.to_crs(epsg=3035)
+    surface.sum_within_radius(malls.geometry.x, malls.geometry.y, 5000, cells='within')
+    return len(surface)
+
+
+# E03/reclassification.py: travel times between pairs of YKR cells
+def prepare_travel_matrix(scale, workdir):
+    frames = synthetic.ykr_matrix(scale)
+    matrix_dir = os.path.join(workdir, 'travel_matrix_{}'.format(scale))
+    build_matrix(frames, matrix_dir, value='pt_r_tt')
+    rng = np.random.default_rng(0)
+    ids = pd.concat(frames)
+    pairs = ids.iloc[rng.integers(0, len(ids), 100000 * scale)]
+    return {'matrix_dir': matrix_dir, 'from_id': pairs['from_id'].to_numpy(),
+            'to_id': pairs['to_id'].to_numpy()}
+
+
+def run_travel_matrix(matrix_dir, from_id, to_id):
+    matrix = TravelMatrix(matrix_dir)
+    matrix.lookup(from_id, to_id)
+    for target in matrix.to_ids:
+        matrix.within(target, 30)
+    return len(from_id)
+
+
+# E04: geocoding of the facilities with the coordinates in the file as fallback
+def prepare_geocode(scale, workdir):
+    return {'facilities': synthetic.facilities(scale)}
+
+
+def _geocode(strings, **kwargs):
+    return stand_ins.geocode(strings, bbox=(-74.0, 45.4, -73.4, 45.8), fail_rate=0.3)
+
+
+def run_geocode(facilities):
+    data_gdf = accessibility.geocode_facilities(facilities, epsg=synthetic.MTL_EPSG,
+                                                geocode=_geocode)
+    return len(data_gdf)
+
+
+# E04: grid of square cells over the Greater Montreal Area, without water
+def prepare_grid_build(scale, workdir):
+    gma_gdf, wtr_gdf = synthetic.montreal_area()
+    # 'scale' times the cells of the 1000 m grid
+    return {'gma_gdf': gma_gdf, 'wtr_gdf': wtr_gdf, 'cell_size': 1000 / np.sqrt(scale)}
+
+
+def run_grid_build(gma_gdf, wtr_gdf, cell_size):
+    return len(accessibility.build_grid(gma_gdf, wtr_gdf, cell_size))
+
+
+def _facilities_mtl(scale):
+    facilities = synthetic.facilities(scale)
+    points = gpd.points_from_xy(facilities['longitude'], facilities['latitude'])
+    return gpd.GeoDataFrame(facilities, geometry=points, crs=4326)
+
+
+# E04/dist_costco_montreal.py: distance from each cell to each facility
+def prepare_distance(scale, workdir):
+    gma_gdf, wtr_gdf = synthetic.montreal_area()
+    grid = accessibility.build_grid(gma_gdf, wtr_gdf, 1000 / np.sqrt(scale))
+    return {'grid': grid, 'facilities': _facilities_mtl(1).to_crs(epsg=synthetic.MTL_EPSG)}
+
+
+def run_distance(grid, facilities):
+    accessibility.distances(grid, facilities)
+    return len(grid) * len(facilities)
+
+
+# E04/time_costco_montreal.py: isochrones and cells whose centroid is inside
+def prepare_isochrones(scale, workdir):
+    gma_gdf, wtr_gdf = synthetic.montreal_area()
+    grid = accessibility.build_grid(gma_gdf, wtr_gdf, 1000 / np.sqrt(scale))
+    return {'grid': grid, 'facilities': _facilities_mtl(1).to_crs(epsg=synthetic.MTL_EPSG)}
+
+
+def run_isochrones(grid, facilities):
+    isochrones = accessibility.fetch_isochrones(facilities, epsg=synthetic.MTL_EPSG,
+                                                client=stand_ins.Client())
+    accessibility.isochrone_classes(grid, facilities, isochrones)
+    return len(grid) * len(isochrones)
+
+
+# Startup: import of the pipeline modules in a new interpreter
+# Plotting, map and routing libraries must not be imported at startup
+LAZY_MODULES = ['matplotlib', 'contextily', 'matplotlib_scalebar', 'svgpath2mpl', 'folium',
+                'openrouteservice', 'osmnx']
+
+
+def prepare_startup(scale, workdir):
+    return {'modules': ['pygis.accessibility', 'pygis.__main__'], 'repeat': scale}
+
+
+def run_startup(modules, repeat):
+    code = ('import sys\n'
+            'import {}\n'
+            'print(\' \'.join(m for m in {!r} if m in sys.modules))')
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    for module in modules:
+        for _ in range(repeat):
+            loaded = subprocess.run([sys.executable, '-c', code.format(module, LAZY_MODULES)],
+                                    cwd=root, check=True, capture_output=True,
+                                    text=True).stdout.split()
+            if loaded:
+                raise RuntimeError('import {} loads {}'.format(module, ', '.join(loaded)))
+    return len(modules) * repeat
+
+
+STAGES = {
+    'startup': (prepare_startup, run_startup),
+    'e01_ingest': (prepare_e01_ingest, run_e01_ingest),
+    'e02_ingest': (prepare_e02_ingest, run_e02_ingest),
+    'e02_ingest_points': (prepare_e02_ingest_points, run_e02_ingest_points),
+    'trajectories': (prepare_trajectories, run_trajectories),
+    'reclassification': (prepare_reclassification, run_reclassification),
+    'spatial_join': (prepare_spatial_join, run_spatial_join),
+    'population_surface': (prepare_population_surface, run_population_surface),
+    'travel_matrix': (prepare_travel_matrix, run_travel_matrix),
+    'geocode': (prepare_geocode, run_geocode),
+    'grid_build': (prepare_grid_build, run_grid_build),
+    'distance': (prepare_distance, run_distance),
+    'isochrones': (prepare_isochrones, run_isochrones),
+}
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local stand-ins for the network services used by the gallery scripts, so
+the benchmarks are repeatable and do not depend on rate limits:
+ - geocode():      gpd.tools.geocode (Nominatim / Photon)
+ - Client:         openrouteservice.Client, only isochrones()
+ - add_basemap():  contextily.add_basemap (map tiles)
+"""
+
+import zlib
+import numpy as np
+import geopandas as gpd
+from shapely.geometry import Point, Polygon
+
+# Helsinki region (lon_min, lat_min, lon_max, lat_max)
+HELSINKI_BBOX = (24.6, 60.1, 25.2, 60.35)
+
+
+def geocode(strings, bbox=HELSINKI_BBOX, fail_rate=0.0, **kwargs):
+    """
+    Same output as gpd.tools.geocode: GeoDataFrame with 'geometry' and
+    'address' in EPSG:4326. Each address gets a fixed point in bbox, a
+    fraction 'fail_rate' of the addresses is not found (empty Point)
+    """
+    strings = list(strings)
+    points = []
+    for string in strings:
+        h = zlib.crc32(string.encode('utf-8'))
+        if (h % 1000) / 1000 < fail_rate:
+            points.append(Point())
+            continue
+        u = (h & 0xFFFF) / 0xFFFF
+        v = (h >> 16) / 0xFFFF
+        points.append(Point(bbox[0] + u * (bbox[2] - bbox[0]), bbox[1] + v * (bbox[3] - bbox[1])))
+    return gpd.GeoDataFrame({'geometry': points, 'address': strings}, crs=4326)
+
+
+class Client:
+    """openrouteservice.Client stand-in, isochrones are circles for a constant speed"""
+
+    def __init__(self, key='', speed=11.0, n_vertices=64):
+        self.speed = speed  # m/s
+        self.n_vertices = n_vertices
+
+    def isochrones(self, locations, range_type='time', profile='driving-car', range=(2400,),
+                   interval=None, validate=False, attributes=None, **kwargs):
+        # GeoJSON FeatureCollection, one feature per interval and location
+        max_range = max(range)
+        values = np.arange(interval, max_range + 1, interval) if interval else np.array(range)
+        angle = np.linspace(0, 2 * np.pi, self.n_vertices, endpoint=False)
+        features = []
+        for group_index, (lon, lat) in enumerate(locations):
+            for value in values:
+                meters = value * self.speed if range_type == 'time' else value
+                dlat = meters / 110540 * np.sin(angle)
+                dlon = meters / (111320 * np.cos(np.radians(lat))) * np.cos(angle)
+                ring = Polygon(np.column_stack([lon + dlon, lat + dlat]))
+                properties = {'group_index': group_index, 'value': float(value),
+                              'center': [lon, lat]}
+                if attributes and 'total_pop' in attributes:
+                    properties['total_pop'] = 0.0
+                features.append({'type': 'Feature', 'properties': properties,
+                                 'geometry': ring.__geo_interface__})
+        return {'type': 'FeatureCollection', 'features': features}
+
+
+def add_basemap(ax, crs=None, source=None, zorder=None, **kwargs):
+    """contextily.add_basemap stand-in, fills the axes background instead of fetching tiles"""
+    ax.set_facecolor('#DDDDDD')
+    return ax
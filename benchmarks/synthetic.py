@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic data for the benchmarks, scaled from the bundled files in ../data
+
+scale = 1 has about the size of the bundled file, scale = k has k times
+the rows (or cells). Copies of the rows are jittered so they are not
+identical. Data that is not bundled (YKR travel times, Greater Montreal
+rectangle and water bodies) is generated with a similar size and layout.
+All the generators are deterministic for a given scale and seed.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+from shapely.geometry import Point, box
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+
+# Number of cells in the Helsinki region travel time matrix grid (YKR)
+YKR_CELLS = 13231
+# Centre of the YKR cell 5975375 (Railway station) in EPSG:3067
+YKR_CENTER = (385875.0, 6672125.0)
+# Projection for Montreal
+MTL_EPSG = 32188
+
+
+def _tile(df, scale):
+    # Rows repeated 'scale' times, and the copy number of each row
+    n = len(df)
+    rows = df.iloc[np.tile(np.arange(n), scale)].reset_index(drop=True)
+    copy = np.repeat(np.arange(scale), n)
+    return rows, copy
+
+
+def travel_times(scale, path, seed=0):
+    """travelTimes_2015_Helsinki.txt with 'scale' times the rows, written to 'path'"""
+    rng = np.random.default_rng(seed)
+    df = pd.read_csv(os.path.join(DATA_DIR, 'travelTimes_2015_Helsinki.txt'), sep=';')
+    df, copy = _tile(df, scale)
+    for col in ['from_x', 'from_y', 'to_x', 'to_y']:
+        df[col] = df[col] + np.where(copy > 0, rng.normal(0, 0.01, len(df)), 0)
+    df.to_csv(path, sep=';', index=False)
+    return path
+
+
+def posts(scale, path, seed=0):
+    """southafrica_posts.csv with 'scale' times the rows, written to 'path'"""
+    rng = np.random.default_rng(seed)
+    df = pd.read_csv(os.path.join(DATA_DIR, 'southafrica_posts.csv'))
+    df, copy = _tile(df, scale)
+    # Copies are new users around the same places
+    df['userid'] = df['userid'] + copy * 10**8
+    df['lat'] = df['lat'] + np.where(copy > 0, rng.normal(0, 0.01, len(df)), 0)
+    df['lon'] = df['lon'] + np.where(copy > 0, rng.normal(0, 0.01, len(df)), 0)
+    df.to_csv(path, index=False)
+    return path
+
+
+def population_grid(scale, seed=0):
+    """
+    Vaestotietoruudukko_2015 grid (population, geometry) with 'scale' copies
+    of the bundled grid, side by side
+    """
+    rng = np.random.default_rng(seed)
+    pop = gpd.read_file('zip://' + os.path.join(DATA_DIR, 'Vaestotietoruudukko_2015.zip'))
+    pop = pop.rename(columns={'ASUKKAITA': 'population'})[['population', 'geometry']]
+    x_min, y_min, x_max, y_max = pop.total_bounds
+    n_cols = int(np.ceil(np.sqrt(scale)))
+    copies = []
+    for k in range(scale):
+        copy = pop.copy()
+        copy['geometry'] = pop.geometry.translate((k % n_cols) * (x_max - x_min),
+                                                  (k // n_cols) * (y_max - y_min))
+        if k > 0:
+            copy['population'] = (copy['population'] * rng.uniform(0.5, 1.5, len(copy))).astype(int)
+        copies.append(copy)
+    return gpd.GeoDataFrame(pd.concat(copies, ignore_index=True), crs=pop.crs)
+
+
+def shopping_centers(scale):
+    """shopping_centers.txt with 'scale' times the rows, copies have unique names and addresses"""
+    df = pd.read_csv(os.path.join(DATA_DIR, 'shopping_centers.txt'), skipinitialspace=True)
+    df, copy = _tile(df, scale)
+    suffix = np.where(copy > 0, ' #' + copy.astype(str), '')
+    df['name'] = df['name'] + suffix
+    df['address'] = df['address'] + suffix
+    df['id'] = np.arange(len(df))
+    return df
+
+
+def facilities(scale, seed=0):
+    """costco_greater_montreal.txt with 'scale' times the rows, copies jittered ~10 km"""
+    rng = np.random.default_rng(seed)
+    df = pd.read_csv(os.path.join(DATA_DIR, 'costco_greater_montreal.txt'),
+                     skipinitialspace=True, index_col=False)
+    df, copy = _tile(df, scale)
+    suffix = np.where(copy > 0, ' #' + copy.astype(str), '')
+    df['name'] = df['name'] + suffix
+    df['address'] = df['address'] + suffix
+    df['latitude'] = df['latitude'] + np.where(copy > 0, rng.normal(0, 0.1, len(df)), 0)
+    df['longitude'] = df['longitude'] + np.where(copy > 0, rng.normal(0, 0.1, len(df)), 0)
+    return df
+
+
+def montreal_area(seed=0):
+    """
+    Stand-in for greater_montreal/rect.shp and water_mtl.shp (EPSG:32188):
+    rectangle around the Costco locations and a few water bodies
+    """
+    rng = np.random.default_rng(seed)
+    df = facilities(1)
+    points = gpd.GeoSeries(gpd.points_from_xy(df['longitude'], df['latitude']), crs=4326)
+    x_min, y_min, x_max, y_max = points.to_crs(epsg=MTL_EPSG).total_bounds
+    pad = 10000
+    rect = box(x_min - pad, y_min - pad, x_max + pad, y_max + pad)
+    gma_gdf = gpd.GeoDataFrame(geometry=[rect], crs=MTL_EPSG)
+    # River-like band and lakes
+    water = [box(x_min - pad, (y_min + y_max) / 2 - 1500, x_max + pad, (y_min + y_max) / 2 + 1500)]
+    for _ in range(8):
+        x = rng.uniform(x_min, x_max)
+        y = rng.uniform(y_min, y_max)
+        water.append(Point(x, y).buffer(rng.uniform(1000, 4000)))
+    wtr_gdf = gpd.GeoDataFrame(geometry=water, crs=MTL_EPSG)
+    return gma_gdf, wtr_gdf
+
+
+def ykr_travel_times(scale, seed=0):
+    """
+    Stand-in for TravelTimes_to_5975375_RailwayStation.shp (EPSG:3067):
+    250 m cells around the railway station with public transportation time
+    'pt_r_tt' (min) and walking distance 'walk_d' (m), -1 is NoData
+    """
+    from pygis.polygons import polygons_from_arrays
+
+    rng = np.random.default_rng(seed)
+    n_side = int(np.ceil(np.sqrt(YKR_CELLS * scale)))
+    side = 250.0
+    ix, iy = np.meshgrid(np.arange(n_side), np.arange(n_side))
+    x0 = YKR_CENTER[0] + (ix.ravel() - n_side / 2) * side
+    y0 = YKR_CENTER[1] + (iy.ravel() - n_side / 2) * side
+    n = len(x0)
+    # Closed square rings, 5 vertices per cell
+    xs = np.stack([x0, x0 + side, x0 + side, x0, x0], axis=1).ravel()
+    ys = np.stack([y0, y0, y0 + side, y0 + side, y0], axis=1).ravel()
+    geometry = polygons_from_arrays(xs, np.arange(0, 5 * n + 1, 5), y=ys, crs=3067)
+
+    dist = np.hypot(x0 + side / 2 - YKR_CENTER[0], y0 + side / 2 - YKR_CENTER[1])
+    pt_r_tt = np.round(5 + dist / 400 + rng.normal(0, 5, n)).clip(1)
+    walk_d = np.round(dist * rng.uniform(1.1, 1.5, n))
+    nodata = rng.random(n) < 0.02
+    pt_r_tt[nodata] = -1
+    walk_d[nodata] = -1
+    return gpd.GeoDataFrame({'from_id': np.arange(n) + 5785640, 'to_id': 5975375,
+                             'pt_r_tt': pt_r_tt.astype(int), 'walk_d': walk_d.astype(int)},
+                            geometry=geometry.values, crs=3067)
+
+
+def ykr_matrix(scale, seed=0):
+    """
+    Stand-in for the Helsinki Region Travel Time Matrix: one DataFrame
+    (from_id, to_id, pt_r_tt) per destination, all the YKR_CELLS cells as
+    origins and 10 * 'scale' destinations
+    """
+    rng = np.random.default_rng(seed)
+    n_side = int(np.ceil(np.sqrt(YKR_CELLS)))
+    ids = np.arange(YKR_CELLS) + 5785640
+    x = (np.arange(YKR_CELLS) % n_side) * 250.0
+    y = (np.arange(YKR_CELLS) // n_side) * 250.0
+    targets = rng.choice(YKR_CELLS, size=min(10 * scale, YKR_CELLS), replace=False)
+    frames = []
+    for target in np.sort(targets):
+        dist = np.hypot(x - x[target], y - y[target])
+        pt_r_tt = np.round(5 + dist / 400 + rng.normal(0, 5, YKR_CELLS)).clip(1)
+        pt_r_tt[rng.random(YKR_CELLS) < 0.02] = -1
+        frames.append(pd.DataFrame({'from_id': ids, 'to_id': ids[target],
+                                    'pt_r_tt': pt_r_tt.astype(int)}))
+    return frames
@@ -0,0 +1,3 @@
+"""
+Shared modules for the gallery scripts
+"""
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line entry point for the pipelines, from the root of the repository
+
+$ python -m pygis distance --cell-size 500 --figure dist.png --html dist.html
+$ python -m pygis isochrones --ors-key KEY --range 3600 --interval 600 --output results/time.gpkg
+
+The output of each stage is cached in --cache-dir, a new run only re-runs
+the stages whose parameters or inputs changed. Changing --bins or the
+output files does not geocode or build the grid again.
+Pipeline modules are imported after parsing the arguments, and plotting /
+map libraries only when --figure / --html are given. Figures are rendered
+without display (Agg).
+"""
+
+import sys
+import argparse
+
+DISTANCE_BINS = [5, 10, 15, 20, 25, 35, 55]
+
+
+def _parser():
+    parser = argparse.ArgumentParser(prog='python -m pygis', description=__doc__.split('\n')[1])
+    subparsers = parser.add_subparsers(dest='pipeline', required=True)
+
+    for name, helptext in [('distance', 'distance from each cell to the closest Costco'),
+                           ('isochrones', 'driving time from each cell to the closest Costco')]:
+        sub = subparsers.add_parser(name, help=helptext)
+        sub.add_argument('--facilities', default=None,
+                         help='CSV with name, address, latitude, longitude '
+                              '(default: data/costco_greater_montreal.txt)')
+        sub.add_argument('--area', default=None,
+                         help='zip with rect.shp and water_mtl.shp (default: data/greater_montreal.zip)')
+        sub.add_argument('--epsg', type=int, default=32188, help='projected CRS of the grid')
+        sub.add_argument('--cell-size', type=float, default=1000, help='side of the cells (m)')
+        if name == 'isochrones':
+            sub.add_argument('--range', type=int, default=2400, help='largest isochrone (s)')
+            sub.add_argument('--interval', type=int, default=300, help='interval between isochrones (s)')
+            sub.add_argument('--ors-key', default='', help='OpenRouteService API key')
+        else:
+            sub.add_argument('--bins', type=float, nargs='+', default=DISTANCE_BINS,
+                             help='class limits of the map (km)')
+        sub.add_argument('--processes', type=int, default=None,
+                         help='worker processes for the grid operations (default: all CPUs)')
+        sub.add_argument('--cache-dir', default='./cache', help='directory for the stage artifacts')
+        sub.add_argument('--no-cache', action='store_true', help='run all the stages, without cache')
+        sub.add_argument('--output', default=None, help='save the grid as GeoPackage / GeoParquet')
+        sub.add_argument('--figure', default=None, help='save the map as image (PNG, PDF, ...)')
+        sub.add_argument('--html', default=None, help='save the interactive map as HTML')
+        sub.add_argument('--profile', action='store_true', help='print the time per stage')
+    return parser
+
+
+def main(argv=None):
+    args = _parser().parse_args(argv)
+    from pygis import accessibility
+    from pygis.profiling import profiler
+
+    inputs = {'epsg': args.epsg, 'cell_size': args.cell_size, 'processes': args.processes,
+              'cache_dir': None if args.no_cache else args.cache_dir}
+    if args.facilities is not None:
+        inputs['facilities_path'] = args.facilities
+    if args.area is not None:
+        inputs['zip_path'] = args.area
+
+    if args.pipeline == 'distance':
+        grid, facilities, area = accessibility.distance_pipeline(**inputs)
+        column, legend = 'dist_min_km', 'Distance to closest Costco (km)'
+    else:
+        grid, facilities, area = accessibility.isochrone_pipeline(
+            max_range=args.range, interval=args.interval, key=args.ors_key, **inputs)
+        column, legend = 'iso_costco_min_label', 'Driving time to closest Costco (minutes)'
+
+    if args.output:
+        from pygis.output import write_layer
+        write_layer(grid, args.output)
+    if args.figure:
+        import matplotlib
+        matplotlib.use('Agg')
+        bounds = accessibility.grid_bounds(area)
+        if args.pipeline == 'distance':
+            ax = accessibility.plot_distances(grid, facilities, bounds, bins=args.bins)
+        else:
+            ax = accessibility.plot_isochrones(grid, facilities, bounds, max_range=args.range,
+                                               interval=args.interval)
+        ax.figure.savefig(args.figure, dpi=150, bbox_inches='tight')
+    if args.html:
+        accessibility.interactive_map(grid, facilities, column, legend, args.html)
+    if args.profile:
+        profiler.summary()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
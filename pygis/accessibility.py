@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Accessibility of facilities over a grid of square cells, the pipeline of
+E04/dist_costco_montreal.py and E04/time_costco_montreal.py
+
+Stages:
+ load_facilities()     CSV with name, address, latitude, longitude
+ geocode_facilities()  geocoded Points, the coordinates in the file as fallback
+ load_area()           area rectangle and water bodies (read_area(), read_water())
+ build_grid()          square cells over the area (grid_cells()), without water
+                       (remove_water())
+ fetch_isochrones()    driving-time isochrones of each facility (OpenRouteService)
+ distances()           distance from each cell to each facility, and minimum
+ isochrone_classes()   isochrone of each cell for each facility, and minimum
+ plot_distances(), plot_isochrones(), interactive_map()
+
+Only numpy, pandas and geopandas are imported with the module. Plotting
+(matplotlib, contextily, matplotlib_scalebar, svgpath2mpl), the interactive
+map (folium) and routing (openrouteservice) are imported by the stages that
+use them, so runs without plots start fast.
+
+distance_pipeline() and isochrone_pipeline() chain the stages, with
+cache_dir the output of each stage is saved as an artifact (pygis.artifacts)
+and a new run only re-runs the stages whose parameters or inputs changed.
+
+$ python -m pygis distance --cell-size 500 --output results/dist.gpkg
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from pygis.profiling import stage
+from pygis.artifacts import ArtifactStore
+from pygis import partition, polygons, shared_memory
+from pygis.polygons import polygons_from_arrays
+from pygis.partition import parallel_map, parallel_overlay
+from pygis.shared_memory import map_slices
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
+# Projection for Montreal: https://epsg.io/32198
+MTL_EPSG = 32188
+# Costco logo, from https://seekvectors.com/post/costco-icon
+COSTCO_PATH = """M995.1,61.2c-84.7-24.8-180.9-38-276.7-38C376.8,23.2,
+                 66.8,239,12.7,508.6c-52.6,263.5,166.2,468.2,498.4,468.2
+                 c75.7,0,235.2-11,308.7-36.8l81.4-345.7c-78.5,52.7-162.4,
+                 85.8-259.7,85.8c-126.7,0-220.8-78.4-200.5-180.2
+                 C461,399.5,580.4,319.9,707.1,319.9c95.8,0,172.2,42.9,230.2,92.8L995.1,61.2z"""
+
+
+# Columns of the facilities file
+FACILITY_DTYPES = {'name': str, 'address': str, 'latitude': np.float64, 'longitude': np.float64}
+
+
+def load_facilities(path=os.path.join(DATA_DIR, 'costco_greater_montreal.txt')):
+    """DataFrame with name, address and the fallback latitude, longitude"""
+    return pd.read_csv(path, sep=',', skipinitialspace=True, index_col=False,
+                       dtype=FACILITY_DTYPES)
+
+
+def read_facilities(path=os.path.join(DATA_DIR, 'costco_greater_montreal.txt'), epsg=MTL_EPSG,
+                    geocode=None):
+    """Facilities in 'path', geocoded"""
+    return geocode_facilities(load_facilities(path), epsg, geocode)
+
+
+def geocode_facilities(facilities, epsg=MTL_EPSG, geocode=None):
+    """
+    Geocode the addresses (photon uses OSM), if an address was not geocoded
+    use the coordinates in the file. The column 'source' is 'geocoder' or
+    'file' for each row ('geocoded' is True for 'geocoder').
+    geocode: function with the signature of gpd.tools.geocode, e.g. a local stand-in
+    """
+    with stage('geocoding') as st:
+        if geocode is None:
+            geocode = gpd.tools.geocode
+        geocode_gdf = geocode(facilities['address'], provider='photon',
+                              user_agent='geocode-rcassani')
+        # Geocoded points, aligned with the facilities, OSM uses WGS84 (EPSG:4326)
+        points = gpd.GeoSeries(geocode_gdf.geometry, crs=4326).reindex(facilities.index)
+        geocoded = ~(points.isna() | points.is_empty).to_numpy()
+        # Fill the missing points with the coordinates in the file
+        lon = facilities['longitude'].to_numpy(dtype=np.float64).copy()
+        lat = facilities['latitude'].to_numpy(dtype=np.float64).copy()
+        lon[geocoded] = points[geocoded].x.to_numpy()
+        lat[geocoded] = points[geocoded].y.to_numpy()
+        geometry = gpd.GeoSeries(gpd.points_from_xy(lon, lat), index=facilities.index, crs=4326)
+        facilities = gpd.GeoDataFrame(pd.DataFrame(facilities).drop(columns='geometry',
+                                                                    errors='ignore'),
+                                      geometry=geometry.to_crs(epsg=epsg))
+        facilities['geocoded'] = geocoded
+        facilities['source'] = pd.Categorical(np.where(geocoded, 'geocoder', 'file'),
+                                              categories=['geocoder', 'file'])
+        st.items = len(facilities)
+    return facilities
+
+
+def read_area(zip_path=os.path.join(DATA_DIR, 'greater_montreal.zip'), epsg=MTL_EPSG):
+    """Rectangle encompassing the Greater Montreal Area"""
+    return gpd.read_file('zip://' + zip_path + '!rect.shp').to_crs(epsg=epsg)
+
+
+def read_water(zip_path=os.path.join(DATA_DIR, 'greater_montreal.zip'), epsg=MTL_EPSG):
+    """Water bodies in the Greater Montreal Area rectangle"""
+    return gpd.read_file('zip://' + zip_path + '!water_mtl.shp').to_crs(epsg=epsg)
+
+
+def load_area(zip_path=os.path.join(DATA_DIR, 'greater_montreal.zip'), epsg=MTL_EPSG):
+    """(area, water) GeoDataFrames"""
+    with stage('load shapefiles'):
+        return read_area(zip_path, epsg), read_water(zip_path, epsg)
+
+
+def grid_bounds(area):
+    """Bounds of the area rounded to the closest kilometer"""
+    bounds = area.geometry.iloc[0].bounds
+    return (np.floor(bounds[0] / 1000) * 1000, np.floor(bounds[1] / 1000) * 1000,
+            np.ceil(bounds[2] / 1000) * 1000, np.ceil(bounds[3] / 1000) * 1000)
+
+
+def grid_cells(area, cell_size=1000):
+    """Square cells of side 'cell_size' (m) over the area"""
+    with stage('grid') as st:
+        x_min, y_min, x_max, y_max = grid_bounds(area)
+        # Cells ordered by x then y, closed rings of 5 vertices
+        x, y = np.meshgrid(np.arange(x_min, x_max, cell_size), np.arange(y_min, y_max, cell_size),
+                           indexing='ij')
+        x = x.ravel()
+        y = y.ravel()
+        xs = np.stack([x, x + cell_size, x + cell_size, x, x], axis=1).ravel()
+        ys = np.stack([y, y, y + cell_size, y + cell_size, y], axis=1).ravel()
+        cells = polygons_from_arrays(xs, np.arange(0, len(xs) + 1, 5), y=ys, crs=area.crs)
+        grid = gpd.GeoDataFrame(geometry=cells.values, crs=area.crs)
+        grid['index_col'] = grid.index
+        st.items = len(grid)
+    return grid
+
+
+def remove_water(grid, water, processes=None):
+    """Cells without the water bodies"""
+    with stage('water overlay') as st:
+        grid = parallel_overlay(grid, water, how='difference', processes=processes)
+        st.items = len(grid)
+    return grid
+
+
+def build_grid(area, water, cell_size=1000, processes=None):
+    """Square cells of side 'cell_size' (m) over the area, without the water bodies"""
+    return remove_water(grid_cells(area, cell_size), water, processes)
+
+
+def fetch_isochrones(facilities, epsg=MTL_EPSG, max_range=2400, interval=300, key='',
+                     client=None):
+    """
+    Driving-time isochrones (s) of each facility, from OpenRouteService
+    client: object with the isochrones() method of openrouteservice.Client
+    """
+    with stage('ors isochrones') as st:
+        if client is None:
+            import openrouteservice as ors
+            client = ors.Client(key=key)
+        facilities = facilities.to_crs(epsg=4326)
+        isos_gdfs = []
+        for ix, facility in facilities.iterrows():
+            coordinate = [[facility['geometry'].x, facility['geometry'].y]]
+            # Query for Isochrone, it results a GeoJSON
+            iso = client.isochrones(locations=coordinate, range_type='time',
+                                    profile='driving-car', range=[max_range], validate=False,
+                                    interval=interval, attributes=['total_pop'])
+            # OpenRouteService uses WGS84 (EPSG:4326)
+            iso_gdf = gpd.GeoDataFrame.from_features(iso, crs=4326)
+            iso_gdf['name'] = facility['name']
+            iso_gdf['group_index'] = ix
+            isos_gdfs.append(iso_gdf)
+        # All the facilities must have the same number of isochrones
+        if len(set(len(iso_gdf) for iso_gdf in isos_gdfs)) > 1:
+            raise ValueError('All points must have the same number of isochrones')
+        isochrones = pd.concat(isos_gdfs).to_crs(epsg=epsg)
+        st.items = len(isochrones)
+    return isochrones
+
+
+def _centroids(grid):
+    # Centroid coordinates of the cells, the only grid data sent to the isochrone workers
+    centroids = grid.geometry.centroid
+    return centroids.x.to_numpy(), centroids.y.to_numpy()
+
+
+def _contains(polygon, x, y):
+    # Points (x, y) inside the polygon, as Point(x, y).within(polygon)
+    if hasattr(shapely, 'contains_xy'):
+        return shapely.contains_xy(polygon, x, y)
+    from shapely.vectorized import contains
+    return contains(polygon, x, y)
+
+
+def _distance_part(cells, points):
+    # Worker: distance from each cell of a part (0 inside the cell) to each facility
+    return pd.DataFrame({label: cells.distance(point) for label, point in points},
+                        index=cells.index)
+
+
+def _isochrone_slice(inputs, out, start, stop, isochrones):
+    # Worker: number of isochrones of each facility with the centroids start:stop
+    x = inputs['x'][start:stop]
+    y = inputs['y'][start:stop]
+    for column, polygon in isochrones:
+        out[start:stop, column] += _contains(polygon, x, y)
+
+
+def distances(grid, facilities, processes=None):
+    """
+    Copy of the grid with columns distXX (m) from each cell to each facility XX,
+    dist_min and dist_min_km. The distance is to the polygon of the cell
+    """
+    with stage('distances') as st:
+        grid = grid.copy()
+        dist_labels = ['dist' + '{:02}'.format(ix) for ix in facilities.index]
+        # One pool for all the facilities, the cells are packed once
+        points = list(zip(dist_labels, facilities.geometry))
+        dist = parallel_map(grid.geometry, _distance_part, args=(points,), processes=processes)
+        grid[dist_labels] = dist[dist_labels]
+        grid['dist_min'] = grid[dist_labels].min(axis=1)
+        grid['dist_min_km'] = grid['dist_min'] / 1000
+        st.items = len(grid) * len(facilities)
+    return grid
+
+
+def isochrone_classes(grid, facilities, isochrones, processes=None):
+    """
+    Copy of the grid with columns iso_costco_XX for each facility XX, with the number of the
+    smallest isochrone (1 for the first interval) that has the centroid of
+    the cell, N+1 if none of the N isochrones has it, iso_costco_min and
+    iso_costco_min_label (upper bound in minutes)
+    """
+    with stage('isochrone classification') as st:
+        grid = grid.copy()
+        n_isos = len(isochrones) // len(facilities)
+        # (column of the facility, isochrone) pairs, sent with each task
+        columns = {name: k for k, name in enumerate(facilities['name'])}
+        pairs = [(columns[name], polygon) for name, polygon
+                 in zip(isochrones['name'], isochrones.geometry) if name in columns]
+        x, y = _centroids(grid)
+        counts = map_slices(_isochrone_slice, {'x': x, 'y': y}, (len(grid), len(facilities)),
+                            np.int16, args=(pairs,), processes=processes)
+        # Nested isochrones: the cell is in the smallest one and all the larger ones
+        labels = ['iso_costco_' + '{:02}'.format(ix) for ix in facilities.index]
+        grid[labels] = pd.DataFrame((n_isos + 1 - counts).astype(np.int64), index=grid.index,
+                                    columns=labels)
+        grid['iso_costco_min'] = grid[labels].min(axis=1)
+        grid['iso_costco_min_label'] = grid['iso_costco_min'] * isochrones['value'].min() / 60
+        st.items = len(grid) * len(isochrones)
+    return grid
+
+
+def _plot(grid, facilities, bounds, title, **kwargs):
+    # Cells, basemap and facilities with the Costco marker
+    import matplotlib as mpl
+    import contextily as cx
+    from matplotlib_scalebar.scalebar import ScaleBar
+    from svgpath2mpl import parse_path
+
+    marker = parse_path(COSTCO_PATH).transformed(mpl.transforms.Affine2D().scale(1, -1))
+    ax = grid.plot(linewidth=0, legend=True, zorder=2, **kwargs)
+    # Tile fetches, timed apart from the rendering
+    with stage('basemap'):
+        cx.add_basemap(ax, crs=grid.crs, source=cx.providers.Stamen.TonerBackground, zorder=1)
+        cx.add_basemap(ax, crs=grid.crs, source=cx.providers.Stamen.TonerLabels, zorder=4)
+    ax.set_title(title)
+    facilities.plot(facecolor='#E21D39', edgecolor='k', ax=ax, marker=marker, markersize=500,
+                    zorder=5)
+    facilities.plot(color='black', ax=ax, markersize=10, zorder=5)
+    for x, y, label in zip(facilities.geometry.x, facilities.geometry.y, facilities.name):
+        ax.annotate(label, xy=(x, y), xytext=(14, -10), textcoords="offset points", zorder=5)
+    ax.set_xlim((bounds[0], bounds[2]))
+    ax.set_ylim((bounds[1], bounds[3]))
+    ax.axes.xaxis.set_visible(False)
+    ax.axes.yaxis.set_visible(False)
+    ax.add_artist(ScaleBar(dx=1, location='lower right'))
+    return ax
+
+
+def plot_distances(grid, facilities, bounds, bins=(5, 10, 15, 20, 25, 35, 55)):
+    with stage('plot'):
+        return _plot(grid, facilities, bounds, 'Distance to closest Costco (km)',
+                     column='dist_min_km', cmap='viridis_r', scheme='userdefined',
+                     classification_kwds={'bins': list(bins)}, alpha=0.5)
+
+
+def plot_isochrones(grid, facilities, bounds, max_range=2400, interval=300):
+    with stage('plot'):
+        ax = _plot(grid, facilities, bounds, 'Driving time to closest Costco (minutes)',
+                   column='iso_costco_min', cmap='viridis_r', categorical=True, alpha=0.8)
+        # Replace categorical legends with custom legends
+        # https://stackoverflow.com/a/66212945/4859684
+        # The classes are ints, the legend entries read '1', '2', ...
+        minutes = interval // 60
+        n_classes = max_range // interval + 1
+        labels = {str(k): '{:2} - {:2} min'.format((k - 1) * minutes, k * minutes)
+                  for k in range(1, n_classes)}
+        labels[str(n_classes)] = '{:2} +    min'.format((n_classes - 1) * minutes)
+        for txt in ax.get_legend().texts:
+            if txt.get_text() in labels:
+                txt.set_text(labels[txt.get_text()])
+        return ax
+
+
+def interactive_map(grid, facilities, column, legend_name, path):
+    """Choropleth of 'column' with a marker per facility, saved as HTML in 'path'"""
+    import folium
+
+    with stage('interactive map'):
+        m = folium.Map(location=[45.5765, -73.6276], zoom_start=11, tiles='cartodbpositron')
+        folium.Choropleth(
+            geo_data=grid,
+            data=grid,
+            columns=['index_col', column],
+            popup=folium.Popup("feature.properties.index_col"),
+            key_on='feature.properties.index_col',
+            fill_color='YlGnBu',
+            fill_opacity=0.5,
+            line_weight=0,
+            legend_name=legend_name,
+        ).add_to(m)
+        for ix, item in facilities.iterrows():
+            folium.Marker([item.latitude, item.longitude],
+                          popup=item['name'],
+                          tooltip=item['name'],
+                          icon=folium.Icon(color='red', icon='shopping-cart', prefix='fa')).add_to(m)
+        m.save(path)
+    return m
+
+
+def _implementation(obj, default):
+    # Name of the function or class of a geocoder / client, hashed in the artifact
+    # keys so results of stand-ins and of the real services are cached apart
+    if obj is None:
+        return default
+    target = obj if hasattr(obj, '__qualname__') else type(obj)
+    return target.__module__ + '.' + target.__qualname__
+
+
+def _stages(store, facilities_path, zip_path, epsg, cell_size, processes, geocode):
+    # Artifacts shared by the two pipelines, code= lists the helpers each stage calls
+    facilities = store.stage('facilities', read_facilities, {'path': facilities_path, 'epsg': epsg},
+                             files=['path'], unhashed={'geocode': geocode},
+                             tags={'geocode': _implementation(geocode, 'geopandas.tools.geocode')},
+                             code=[load_facilities, geocode_facilities])
+    area = store.stage('area', read_area, {'zip_path': zip_path, 'epsg': epsg}, files=['zip_path'])
+    water = store.stage('water', read_water, {'zip_path': zip_path, 'epsg': epsg},
+                        files=['zip_path'])
+    cells = store.stage('cells', grid_cells, {'cell_size': cell_size}, deps=[area],
+                        code=[grid_bounds, polygons])
+    grid = store.stage('grid', remove_water, deps=[cells, water],
+                       unhashed={'processes': processes}, code=[partition, shared_memory])
+    return facilities, area, grid
+
+
+def distance_pipeline(facilities_path=os.path.join(DATA_DIR, 'costco_greater_montreal.txt'),
+                      zip_path=os.path.join(DATA_DIR, 'greater_montreal.zip'), epsg=MTL_EPSG,
+                      cell_size=1000, processes=None, geocode=None, cache_dir=None):
+    """
+    (grid, facilities, area) with the distance from each cell to the closest facility
+    cache_dir: directory for the artifacts of the stages (pygis.artifacts),
+               only the stages whose parameters or inputs changed are run
+    """
+    store = ArtifactStore(cache_dir, verbose=cache_dir is not None)
+    facilities, area, grid = _stages(store, facilities_path, zip_path, epsg, cell_size,
+                                     processes, geocode)
+    metrics = store.stage('distances', distances, deps=[grid, facilities],
+                          unhashed={'processes': processes},
+                          code=[_distance_part, partition, shared_memory])
+    return metrics.load(), facilities.load(), area.load()
+
+
+def isochrone_pipeline(facilities_path=os.path.join(DATA_DIR, 'costco_greater_montreal.txt'),
+                       zip_path=os.path.join(DATA_DIR, 'greater_montreal.zip'), epsg=MTL_EPSG,
+                       cell_size=1000, max_range=2400, interval=300, key='', processes=None,
+                       geocode=None, client=None, cache_dir=None):
+    """
+    (grid, facilities, area) with the driving time from each cell to the closest facility
+    cache_dir: as in distance_pipeline()
+    """
+    store = ArtifactStore(cache_dir, verbose=cache_dir is not None)
+    facilities, area, grid = _stages(store, facilities_path, zip_path, epsg, cell_size,
+                                     processes, geocode)
+    isochrones = store.stage('isochrones', fetch_isochrones,
+                             {'epsg': epsg, 'max_range': max_range, 'interval': interval},
+                             deps=[facilities], unhashed={'key': key, 'client': client},
+                             tags={'client': _implementation(client, 'openrouteservice.Client')})
+    metrics = store.stage('isochrone_classes', isochrone_classes,
+                          deps=[grid, facilities, isochrones], unhashed={'processes': processes},
+                          code=[_centroids, _contains, _isochrone_slice, shared_memory])
+    return metrics.load(), facilities.load(), area.load()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cache of the outputs of pipeline stages as content-hashed artifacts
+
+The key of an artifact is a hash of:
+ - the name of the stage and the source code of its function, with the
+   source of the helpers and modules it calls, listed in code= (so editing
+   one of them invalidates it, editing e.g. the plotting code does not)
+ - its parameters (JSON), with the content of the input files
+ - tags, values that change the result but are not arguments of the
+   function (e.g. the type of the routing client)
+ - the keys of the artifacts it depends on
+A stage runs only if there is no artifact with its key, so changing a
+parameter re-runs the stages that depend on it, and nothing else.
+Artifacts are loaded lazily: if the last stage is cached, the stages before
+it are not loaded.
+
+store = ArtifactStore('./cache')
+area = store.stage('area', load_area, {'zip_path': path, 'epsg': 32188}, files=['zip_path'])
+grid = store.stage('grid', grid_cells, {'cell_size': 1000}, deps=[area],
+                   code=[grid_bounds, pygis.polygons])
+grid.load()
+
+Artifacts are pickle files, <cache_dir>/<stage>-<key>.pkl, with a JSON file
+describing the parameters. ArtifactStore(None) keeps them in memory only.
+"""
+
+import os
+import json
+import pickle
+import hashlib
+import inspect
+
+# Bump to invalidate all the artifacts
+CACHE_VERSION = 1
+
+# SHA-256 of the files hashed in this process, by (path, size, mtime)
+_DIGESTS = {}
+
+
+def file_digest(path):
+    """SHA-256 of the content of a file, computed once per (path, size, mtime)"""
+    stat = os.stat(path)
+    digest_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    if digest_key not in _DIGESTS:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as fin:
+            for block in iter(lambda: fin.read(1 << 20), b''):
+                digest.update(block)
+        _DIGESTS[digest_key] = digest.hexdigest()
+    return _DIGESTS[digest_key]
+
+
+def _code_digest(func, code=()):
+    # Source of the stage function and of the functions / modules in 'code'
+    digest = hashlib.sha256()
+    for obj in [func] + list(code):
+        name = getattr(obj, '__module__', None) or ''
+        name += '.' + getattr(obj, '__qualname__', getattr(obj, '__name__', repr(obj)))
+        try:
+            source = inspect.getsource(obj)
+        except (OSError, TypeError):
+            source = ''
+        digest.update((name + '\n' + source).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class Artifact:
+    def __init__(self, store, name, key, compute):
+        self.store = store
+        self.name = name
+        self.key = key
+        self._compute = compute
+
+    @property
+    def path(self):
+        if self.store.cache_dir is None:
+            return None
+        return os.path.join(self.store.cache_dir, '{}-{}.pkl'.format(self.name, self.key[:16]))
+
+    @property
+    def cached(self):
+        return self.key in self.store.memory or (self.path is not None and
+                                                 os.path.exists(self.path))
+
+    def load(self):
+        """Value of the artifact, computed (and saved) if not cached"""
+        memory = self.store.memory
+        if self.key not in memory:
+            if self.path is not None and os.path.exists(self.path):
+                with open(self.path, 'rb') as fin:
+                    memory[self.key] = pickle.load(fin)
+                self.store.log(self.name, 'cached')
+            else:
+                memory[self.key] = self._compute()
+                self.store.log(self.name, 'computed')
+                if self.path is not None:
+                    self.store.save(self, memory[self.key])
+        return memory[self.key]
+
+
+class ArtifactStore:
+    def __init__(self, cache_dir='./cache', verbose=True):
+        self.cache_dir = cache_dir
+        self.verbose = verbose
+        self.memory = {}
+        self.manifests = {}
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def log(self, name, status):
+        if self.verbose:
+            print('{:<24} {}'.format(name, status))
+
+    def stage(self, name, func, params=None, deps=(), files=(), unhashed=None, tags=None,
+              code=()):
+        """
+        Artifact of func(*[dep.load() for dep in deps], **params, **unhashed)
+        files:    names of the params that are paths, hashed by content
+        code:     functions and modules called by func whose source is hashed
+                  with it, e.g. [grid_bounds, pygis.polygons]
+        unhashed: arguments that do not change the result (workers, clients, keys)
+        tags:     values hashed in the key but not passed to func, e.g. the
+                  type of a client given in unhashed
+        """
+        params = {} if params is None else dict(params)
+        unhashed = {} if unhashed is None else dict(unhashed)
+        hashed = {k: (file_digest(v) if k in files else v) for k, v in params.items()}
+        manifest = {'stage': name, 'version': CACHE_VERSION, 'code': _code_digest(func, code),
+                    'params': hashed, 'tags': {} if tags is None else dict(tags),
+                    'deps': [dep.key for dep in deps]}
+        key = hashlib.sha256(json.dumps(manifest, sort_keys=True, default=str)
+                             .encode('utf-8')).hexdigest()
+
+        def compute():
+            return func(*[dep.load() for dep in deps], **params, **unhashed)
+
+        self.manifests[key] = manifest
+        return Artifact(self, name, key, compute)
+
+    def save(self, artifact, value):
+        # Written to a temporary file first, so interrupted runs leave no partial artifacts
+        tmp_path = artifact.path + '.tmp'
+        with open(tmp_path, 'wb') as fout:
+            pickle.dump(value, fout, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, artifact.path)
+        with open(artifact.path[:-4] + '.json', 'w') as fout:
+            json.dump(dict(self.manifests[artifact.key], key=artifact.key), fout, indent=1,
+                      default=str)
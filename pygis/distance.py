@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Distances computed directly from longitude and latitude arrays (degrees)
+
+Instead of projecting the geometries to a metric CRS (e.g. UTM 35S or
+EPSG:3035) and measuring the length there, distances are computed on the
+ellipsoid, with one batched call for whole columns:
+ - 'geodesic':  pyproj.Geod (Karney's algorithm), exact on the ellipsoid
+ - 'haversine': great-circle distance on a sphere, faster, error < 0.5%
+"""
+
+import numpy as np
+import pyproj
+
+# Mean Earth radius (meters) used for the haversine distance
+EARTH_RADIUS = 6371008.8
+
+_geods = {}
+
+
+def _geod(ellps):
+    # pyproj.Geod objects are reused across calls
+    if ellps not in _geods:
+        _geods[ellps] = pyproj.Geod(ellps=ellps)
+    return _geods[ellps]
+
+
+def geodesic(lon1, lat1, lon2, lat2, ellps='WGS84'):
+    """Geodesic distance in meters between (lon1, lat1) and (lon2, lat2)"""
+    lon1, lat1, lon2, lat2 = np.broadcast_arrays(*[np.asarray(a, dtype=np.float64)
+                                                    for a in (lon1, lat1, lon2, lat2)])
+    _, _, dist = _geod(ellps).inv(lon1.ravel(), lat1.ravel(), lon2.ravel(), lat2.ravel())
+    return np.asarray(dist).reshape(lon1.shape)
+
+
+def haversine(lon1, lat1, lon2, lat2, radius=EARTH_RADIUS):
+    """Great-circle distance in meters between (lon1, lat1) and (lon2, lat2)"""
+    lon1, lat1, lon2, lat2 = [np.radians(np.asarray(a, dtype=np.float64))
+                              for a in (lon1, lat1, lon2, lat2)]
+    a = (np.sin((lat2 - lat1) / 2) ** 2 +
+         np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * radius * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def distance(lon1, lat1, lon2, lat2, method='geodesic'):
+    """Distance in meters, method is 'geodesic' or 'haversine'"""
+    if method == 'geodesic':
+        return geodesic(lon1, lat1, lon2, lat2)
+    if method == 'haversine':
+        return haversine(lon1, lat1, lon2, lat2)
+    raise ValueError('Unknown distance method: ' + str(method))
+
+
+def step_distance(lon, lat, method='geodesic'):
+    """Distance in meters between consecutive points of a sequence, len(lon) - 1 values"""
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    return distance(lon[:-1], lat[:-1], lon[1:], lat[1:], method=method)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Writing result layers
+
+Formats:
+ 'gpkg'       GeoPackage (default). Features are written in batches, each
+              batch in one transaction, with pyogrio if installed
+ 'parquet'    GeoParquet (needs pyarrow). When appending, the layer is a
+              directory with one part file per chunk, a file written with
+              mode='w' becomes the first part
+ 'shapefile'  Legacy format, only written when asked for explicitly
+              (slow per-feature writes, 2 GB cap, 10-character columns)
+
+The format is taken from the file extension (.gpkg, .parquet), paths
+without extension get the default one. Parent directories are created.
+"""
+
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_FORMAT = 'gpkg'
+EXTENSIONS = {'gpkg': '.gpkg', 'parquet': '.parquet', 'shapefile': '.shp'}
+# Features per transaction when writing GeoPackage
+BATCH_SIZE = 100000
+
+
+def _resolve(path, format):
+    # (path, format) from the path extension or the given format
+    ext = os.path.splitext(str(path))[1]
+    ext = ext.lower()
+    by_ext = {v: k for k, v in EXTENSIONS.items()}
+    if format is None:
+        if ext == '.shp':
+            raise ValueError("Shapefile is a legacy format, use .gpkg or .parquet, "
+                             "or pass format='shapefile'")
+        format = by_ext.get(ext, DEFAULT_FORMAT)
+    if format not in EXTENSIONS:
+        raise ValueError('Unknown format: ' + str(format))
+    if ext not in by_ext:
+        path = str(path) + EXTENSIONS[format]
+    return str(path), format
+
+
+def _layer_name(path):
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _write_gpkg(gdf, path, layer, mode, batch_size):
+    # Each batch is one transaction. pyogrio writes the columns as arrays (no
+    # dict per feature), without it each batch is one to_file() call with fiona
+    try:
+        import pyogrio
+    except ImportError:
+        pyogrio = None
+    for ix in range(0, max(len(gdf), 1), batch_size):
+        chunk = gdf.iloc[ix : ix + batch_size]
+        append = mode == 'a' or ix > 0
+        if pyogrio is not None:
+            pyogrio.write_dataframe(chunk, path, layer=layer, driver='GPKG', append=append)
+        else:
+            chunk.to_file(path, layer=layer, driver='GPKG', mode='a' if append else 'w')
+
+
+def write_layer(gdf, path, layer=None, format=None, mode='w', batch_size=BATCH_SIZE):
+    """
+    Write the GeoDataFrame to 'path'. Returns the path written
+    layer: layer name inside a GeoPackage, by default the file name
+    mode: 'w' to overwrite the layer, 'a' to append to it
+    """
+    path, format = _resolve(path, format)
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, exist_ok=True)
+
+    if format == 'parquet':
+        if mode == 'a':
+            # Append a part file to the dataset directory
+            if os.path.isfile(path):
+                # A file written with mode='w' becomes the first part of the dataset
+                tmp_path = path + '.tmp'
+                os.replace(path, tmp_path)
+                os.makedirs(path)
+                os.replace(tmp_path, os.path.join(path, 'part-00000.parquet'))
+            os.makedirs(path, exist_ok=True)
+            n_parts = len([f for f in os.listdir(path) if f.endswith('.parquet')])
+            gdf.to_parquet(os.path.join(path, 'part-{:05}.parquet'.format(n_parts)))
+        else:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            gdf.to_parquet(path)
+    elif format == 'gpkg':
+        layer = _layer_name(path) if layer is None else layer
+        _write_gpkg(gdf, path, layer, mode, batch_size)
+    else:
+        gdf.to_file(path, driver='ESRI Shapefile', mode=mode)
+    return path
+
+
+class LayerWriter:
+    """
+    Append chunks of a streaming pipeline to one layer
+
+    writer = LayerWriter('./results/posts.gpkg')
+    for chunk in chunks:
+        writer.write(chunk)
+    """
+
+    def __init__(self, path, layer=None, format=None, batch_size=BATCH_SIZE):
+        self.path, self.format = _resolve(path, format)
+        self.layer = layer
+        self.batch_size = batch_size
+        self.n_features = 0
+        self.n_chunks = 0
+
+    def write(self, gdf):
+        # The first chunk replaces the existing layer
+        # Parquet chunks after the first one turn the file into a dataset directory
+        mode = 'w' if self.n_chunks == 0 else 'a'
+        write_layer(gdf, self.path, layer=self.layer, format=self.format, mode=mode,
+                    batch_size=self.batch_size)
+        self.n_features += len(gdf)
+        self.n_chunks += 1
+
+
+def write_layers(layers, format=None, max_workers=None):
+    """
+    Write several layers in parallel threads
+    layers: {path: gdf} or {(path, layer): gdf}
+    Layers going to the same file are written one after the other, since a
+    GeoPackage has a single writer. Returns the list of paths written
+    """
+    by_file = {}
+    for key, gdf in layers.items():
+        path, layer = key if isinstance(key, tuple) else (key, None)
+        path, layer_format = _resolve(path, format)
+        by_file.setdefault(path, []).append((gdf, layer, layer_format))
+
+    def write_file(path):
+        for gdf, layer, layer_format in by_file[path]:
+            write_layer(gdf, path, layer=layer, format=layer_format)
+        return path
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(write_file, by_file))
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Partitioned execution of GeoDataFrame operations on a local process pool
+
+The rows of a GeoDataFrame are split spatially, along a Hilbert curve
+(default) or in grid tiles, so each part is compact in space. Each part is
+processed by a worker process and the results are concatenated back in the
+original row order.
+
+Geometries are sent to the workers as coordinate buffers in shared memory
+(shapely >= 2 and one geometry type), only the offsets and the attribute
+columns are pickled. Otherwise the geometries are pickled.
+
+grid['dist'] = parallel_apply(grid['geometry'], lambda cell: cell.distance(point))
+dist = parallel_map(grid['geometry'], lambda part: pd.DataFrame(
+    {ix: part.distance(point) for ix, point in points.items()}))
+grid = parallel_overlay(grid, wtr_gdf, how='difference')
+join = parallel_sjoin(pop, buffers, predicate='within')
+grid = parallel_to_crs(grid, epsg=4326)
+
+The functions given to parallel_apply() and parallel_map() and their
+arguments are not pickled, the workers are started with 'fork' and inherit
+them, so lambdas and closures can be used. Where 'fork' is not available
+(Windows) the parts are processed one after the other in this process.
+parallel_map() calls the function once per part, so several results (e.g.
+the distance to each of many points) are computed with one pool.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from shapely.geometry import box
+from pygis.post_index import hilbert_key
+from pygis.shared_memory import SharedArray, attach, map_tasks
+
+# shapely.to_ragged_array is available from shapely 2.0
+HAS_RAGGED = hasattr(shapely, 'to_ragged_array')
+# Column with the original row position, used to restore the order
+ROW_COLUMN = '__row'
+# Predicates of parallel_sjoin(), those for which the rows of 'right' that
+# match a part are within the bounds of the part
+SJOIN_PREDICATES = ('intersects', 'within', 'contains', 'contains_properly', 'overlaps',
+                    'crosses', 'touches', 'covers', 'covered_by')
+# (func, args, kwargs) of the running parallel_map() calls, inherited by the
+# forked workers instead of pickled with each task
+_FUNCS = {}
+
+
+def _processes(processes):
+    if processes is None:
+        return os.cpu_count() or 1
+    return processes
+
+
+def partition(geoms, n_parts, method='hilbert', order=16):
+    """
+    List of arrays with the row positions of each part
+    method: 'hilbert' for parts with the same number of rows along a
+            Hilbert curve, 'grid' for square-ish tiles of the bounds
+    """
+    geoms = gpd.GeoSeries(geoms)
+    n = len(geoms)
+    if n == 0:
+        return []
+    n_parts = max(1, min(n_parts, n))
+    bounds = geoms.bounds.to_numpy()
+    cx = (bounds[:, 0] + bounds[:, 2]) / 2
+    cy = (bounds[:, 1] + bounds[:, 3]) / 2
+    # Empty geometries have NaN bounds, they go with the first part
+    cx = np.nan_to_num(cx, nan=np.nanmin(cx) if np.isfinite(cx).any() else 0)
+    cy = np.nan_to_num(cy, nan=np.nanmin(cy) if np.isfinite(cy).any() else 0)
+    x_min, x_max = cx.min(), cx.max()
+    y_min, y_max = cy.min(), cy.max()
+    width = max(x_max - x_min, 1e-12)
+    height = max(y_max - y_min, 1e-12)
+
+    if method == 'hilbert':
+        cells = (1 << order) - 1
+        ix = np.floor((cx - x_min) / width * cells).astype(np.uint64)
+        iy = np.floor((cy - y_min) / height * cells).astype(np.uint64)
+        sort = np.argsort(hilbert_key(ix, iy, order), kind='stable')
+        parts = np.array_split(sort, n_parts)
+    elif method == 'grid':
+        nx = max(1, int(round(np.sqrt(n_parts * width / height))))
+        ny = max(1, int(np.ceil(n_parts / nx)))
+        tx = np.minimum(((cx - x_min) / width * nx).astype(np.int64), nx - 1)
+        ty = np.minimum(((cy - y_min) / height * ny).astype(np.int64), ny - 1)
+        tile = ty * nx + tx
+        sort = np.argsort(tile, kind='stable')
+        splits = np.searchsorted(tile[sort], np.arange(1, nx * ny))
+        parts = np.split(sort, splits)
+    else:
+        raise ValueError('Unknown partition method: ' + str(method))
+    # Rows within each part keep their original order
+    return [np.sort(part) for part in parts if len(part)]
+
+
+class _Geometries:
+    """Geometries of all the parts, packed for the workers"""
+
+    def __init__(self, geoms, parts):
+        geoms = np.asarray(gpd.GeoSeries(geoms).values, dtype=object)
+        self.shared = None
+        self.packed = None
+        types = set(shapely.get_type_id(geoms).tolist()) if HAS_RAGGED else None
+        if HAS_RAGGED and len(types) == 1 and -1 not in types:
+            # Coordinates of all the parts in one shared buffer
+            ragged = [shapely.to_ragged_array(geoms[part]) for part in parts]
+            sizes = [len(coords) for _, coords, _ in ragged]
+            starts = np.r_[0, np.cumsum(sizes)]
+            dim = ragged[0][1].shape[1]
+            self.shared = SharedArray((int(starts[-1]), dim), np.float64)
+            self.packed = []
+            for k, (geom_type, coords, offsets) in enumerate(ragged):
+                self.shared.array[starts[k] : starts[k + 1]] = coords
+                self.packed.append(('ragged', self.shared.spec, int(starts[k]),
+                                    int(starts[k + 1]), int(geom_type), offsets))
+        else:
+            self.packed = [('objects', geoms[part]) for part in parts]
+
+    def close(self):
+        if self.shared is not None:
+            self.shared.unlink()
+            self.shared = None
+
+
+def _unpack(packed):
+    # Worker: geometries of one part
+    if packed[0] == 'objects':
+        return packed[1]
+    _, spec, start, stop, geom_type, offsets = packed
+    coords, shm = attach(spec)
+    try:
+        # from_ragged_array copies the coordinates into GEOS
+        return shapely.from_ragged_array(shapely.GeometryType(geom_type),
+                                         coords[start:stop], offsets)
+    finally:
+        del coords
+        shm.close()
+
+
+def _frame(packed, attributes, crs, geometry_name):
+    # Worker: GeoDataFrame of one part
+    geoms = gpd.GeoSeries(_unpack(packed), index=attributes.index, crs=crs)
+    gdf = gpd.GeoDataFrame(attributes, geometry=geoms, crs=crs)
+    return gdf.rename_geometry(geometry_name) if geometry_name != 'geometry' else gdf
+
+
+def _map_task(task):
+    packed, rows, crs, key = task
+    func, args, kwargs = _FUNCS[key]
+    return func(gpd.GeoSeries(_unpack(packed), index=rows, crs=crs), *args, **kwargs)
+
+
+def _apply_part(part, func, args, kwargs):
+    return part.apply(func, args=args, **kwargs)
+
+
+def _to_crs_task(task):
+    packed, attributes, crs, geometry_name, to_crs_kwargs = task
+    return _frame(packed, attributes, crs, geometry_name).to_crs(**to_crs_kwargs)
+
+
+def _sjoin_task(task):
+    packed, attributes, crs, geometry_name, right, kwargs = task
+    return gpd.sjoin(_frame(packed, attributes, crs, geometry_name), right, **kwargs)
+
+
+def _overlay_task(task):
+    packed, attributes, crs, geometry_name, right, kwargs = task
+    return gpd.overlay(_frame(packed, attributes, crs, geometry_name), right, **kwargs)
+
+
+def _split(gdf, n_parts, processes, method):
+    processes = _processes(processes)
+    n_parts = processes if n_parts is None else n_parts
+    parts = partition(gdf.geometry, n_parts, method=method)
+    return parts, processes
+
+
+def parallel_map(geoms, func, args=(), n_parts=None, processes=None, method='hilbert', **kwargs):
+    """
+    func(part, *args, **kwargs) for each part of the GeoSeries, concatenated
+    in the order of 'geoms'. func returns a Series or DataFrame with one row
+    per geometry and the index of the part (the row positions in 'geoms',
+    the index of 'geoms' is set back on the result)
+    """
+    geoms = gpd.GeoSeries(geoms) if not isinstance(geoms, gpd.GeoSeries) else geoms
+    processes = _processes(processes)
+    parts = partition(geoms, processes if n_parts is None else n_parts, method=method)
+    if not parts:
+        return func(geoms, *args, **kwargs)
+    packed = _Geometries(geoms, parts)
+    key = id(packed)
+    _FUNCS[key] = (func, args, kwargs)
+    try:
+        # Row positions instead of the index labels, which may be duplicated
+        tasks = [(p, pd.Index(part), geoms.crs, key) for p, part in zip(packed.packed, parts)]
+        results = map_tasks(_map_task, tasks, processes)
+    finally:
+        del _FUNCS[key]
+        packed.close()
+    merged = pd.concat(results)
+    if len(merged) != len(geoms):
+        raise ValueError('func returned {} rows for {} geometries'.format(len(merged), len(geoms)))
+    merged = merged.iloc[np.argsort(np.concatenate(parts), kind='stable')]
+    merged.index = geoms.index
+    return merged
+
+
+def parallel_apply(geoms, func, args=(), n_parts=None, processes=None, method='hilbert', **kwargs):
+    """Same as GeoSeries.apply(func, args=args, **kwargs), computed by parts in parallel"""
+    if len(geoms) == 0:
+        return pd.Series([], index=geoms.index, dtype=object)
+    return parallel_map(geoms, _apply_part, args=(func, args, kwargs), n_parts=n_parts,
+                        processes=processes, method=method)
+
+
+def _frame_tasks(gdf, n_parts, processes, method, extra):
+    # Tasks with the geometries and attribute columns of each part
+    parts, processes = _split(gdf, n_parts, processes, method)
+    geometry_name = gdf.geometry.name
+    # Positional index in the workers, _ordered() sets back the one of gdf
+    attributes = pd.DataFrame(gdf.drop(columns=geometry_name)).reset_index(drop=True)
+    attributes[ROW_COLUMN] = np.arange(len(gdf))
+    packed = _Geometries(gdf.geometry, parts)
+    tasks = [(p, attributes.iloc[part], gdf.crs, geometry_name) + extra(part)
+             for p, part in zip(packed.packed, parts)]
+    return tasks, packed, processes
+
+
+def _ordered(results, columns_like):
+    # Concatenate the parts and restore the original row order and index
+    results = [r for r in results if len(r)]
+    if not results:
+        return columns_like.iloc[0:0].copy()
+    merged = pd.concat(results)
+    rows = merged[ROW_COLUMN].to_numpy()
+    order = np.argsort(rows, kind='stable')
+    merged = merged.iloc[order].drop(columns=ROW_COLUMN)
+    merged.index = columns_like.index[rows[order]]
+    return merged
+
+
+def parallel_to_crs(gdf, crs=None, epsg=None, n_parts=None, processes=None, method='hilbert'):
+    """Same as gdf.to_crs(crs, epsg), computed by parts in parallel"""
+    tasks, packed, processes = _frame_tasks(gdf, n_parts, processes, method,
+                                            lambda part: ({'crs': crs, 'epsg': epsg},))
+    try:
+        results = map_tasks(_to_crs_task, tasks, processes)
+    finally:
+        packed.close()
+    return _ordered(results, gdf)
+
+
+def _right_subset(right, part_bounds):
+    # Rows of 'right' whose bounds intersect the bounds of a part
+    hits = right.sindex.query(box(*part_bounds))
+    return right.iloc[np.sort(hits)]
+
+
+def parallel_sjoin(left, right, n_parts=None, processes=None, method='hilbert', **kwargs):
+    """
+    Same as gpd.sjoin(left, right, **kwargs), with 'left' split in parts.
+    Each worker gets the rows of 'right' near its part. Rows are in the
+    order of 'left'. Only for how='inner' or 'left' and the predicates in
+    SJOIN_PREDICATES, with how='right' or distance predicates ('dwithin')
+    the rows of 'right' away from a part would be missed
+    """
+    how = kwargs.get('how', 'inner')
+    predicate = kwargs.get('predicate', kwargs.get('op', 'intersects'))
+    if how not in ('inner', 'left'):
+        raise ValueError("parallel_sjoin supports how='inner', 'left'")
+    if predicate not in SJOIN_PREDICATES:
+        raise ValueError('parallel_sjoin does not support predicate ' + repr(predicate))
+    bounds = left.geometry.bounds.to_numpy()
+
+    def extra(part):
+        b = bounds[part]
+        part_bounds = (np.nanmin(b[:, 0]), np.nanmin(b[:, 1]), np.nanmax(b[:, 2]), np.nanmax(b[:, 3]))
+        return (_right_subset(right, part_bounds), kwargs)
+
+    tasks, packed, processes = _frame_tasks(left, n_parts, processes, method, extra)
+    try:
+        results = map_tasks(_sjoin_task, tasks, processes)
+    finally:
+        packed.close()
+    return _ordered(results, left)
+
+
+def parallel_overlay(df1, df2, how='intersection', n_parts=None, processes=None,
+                     method='hilbert', **kwargs):
+    """
+    Same as gpd.overlay(df1, df2, how=how, **kwargs), with df1 split in parts
+    Only for how='intersection', 'difference' and 'identity', whose rows
+    come from df1. The index is reset as in gpd.overlay
+    """
+    if how not in ('intersection', 'difference', 'identity'):
+        raise ValueError("parallel_overlay supports how='intersection', 'difference', 'identity'")
+    bounds = df1.geometry.bounds.to_numpy()
+    kwargs = dict(kwargs, how=how)
+
+    def extra(part):
+        b = bounds[part]
+        part_bounds = (np.nanmin(b[:, 0]), np.nanmin(b[:, 1]), np.nanmax(b[:, 2]), np.nanmax(b[:, 3]))
+        return (_right_subset(df2, part_bounds), kwargs)
+
+    tasks, packed, processes = _frame_tasks(df1, n_parts, processes, method, extra)
+    try:
+        results = map_tasks(_overlay_task, tasks, processes)
+    finally:
+        packed.close()
+    return _ordered(results, df1).reset_index(drop=True)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact layer of points, stored as arrays of coordinates rather than one
+shapely Point per row
+
+A shapely Point costs around 100 bytes plus the GEOS object, the layer
+keeps x and y as float64 arrays (16 bytes per point) or, with a
+'resolution', as int32 offsets from the origin of the layer (8 bytes per
+point), e.g. resolution=1e-6 deg (~0.1 m) or 0.01 m. Attributes are kept
+in a DataFrame aligned with the points.
+
+posts = read_points_csv('../data/southafrica_posts.csv', x='lon', y='lat', crs=4326,
+                        resolution=1e-6)
+skukuza = posts.within_bbox(31.4, -25.1, 31.7, -24.8)
+dist = skukuza.distance(31.59, -24.99)          # m, geodesic for lon/lat
+utm = skukuza.to_crs(32735)
+gdf = utm.to_geodataframe()                      # shapely Points only here
+
+Bbox filters, distances and reprojection work on the arrays.
+"""
+
+import functools
+import numpy as np
+import pandas as pd
+import pyproj
+from pygis.distance import distance as geo_distance
+
+QUANTIZED_DTYPE = np.int32
+_Q_MAX = np.iinfo(QUANTIZED_DTYPE).max
+
+
+@functools.lru_cache(maxsize=32)
+def _transformer(crs_from, crs_to):
+    return pyproj.Transformer.from_crs(crs_from, crs_to, always_xy=True)
+
+
+class PointLayer:
+    def __init__(self, x, y, crs=None, data=None, resolution=None, origin=None):
+        """
+        x, y:       coordinates in the units of 'crs'
+        data:       DataFrame with one row per point, or None
+        resolution: None to store float64, or the step of int32 coordinates
+        origin:     (x0, y0) of the int32 coordinates, the center of the
+                    points if None
+        """
+        x = np.asarray(x, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        if x.shape != y.shape or x.ndim != 1:
+            raise ValueError('x and y must be 1D arrays of the same length')
+        if data is not None and len(data) != len(x):
+            raise ValueError('data must have one row per point')
+        self.crs = None if crs is None else pyproj.CRS.from_user_input(crs)
+        self.data = None if data is None else pd.DataFrame(data).reset_index(drop=True)
+        self.resolution = resolution
+        if resolution is None:
+            self.origin = None
+            self._x = x
+            self._y = y
+        else:
+            if origin is None:
+                origin = ((np.nanmin(x) + np.nanmax(x)) / 2, (np.nanmin(y) + np.nanmax(y)) / 2) \
+                    if len(x) else (0.0, 0.0)
+            self.origin = (float(origin[0]), float(origin[1]))
+            self._x = _quantize(x, self.origin[0], resolution)
+            self._y = _quantize(y, self.origin[1], resolution)
+
+    @classmethod
+    def from_geoseries(cls, geoms, data=None, resolution=None, origin=None):
+        """Layer from a GeoSeries (or GeoDataFrame) of Points"""
+        if hasattr(geoms, 'geometry') and data is None and len(geoms.columns) > 1:
+            data = pd.DataFrame(geoms.drop(columns=geoms.geometry.name))
+        geoms = geoms.geometry if hasattr(geoms, 'geometry') else geoms
+        return cls(geoms.x.to_numpy(), geoms.y.to_numpy(), crs=geoms.crs, data=data,
+                   resolution=resolution, origin=origin)
+
+    @classmethod
+    def _raw(cls, qx, qy, crs, data, resolution, origin):
+        # Layer from the stored arrays, without quantizing again
+        layer = cls.__new__(cls)
+        layer._x, layer._y = qx, qy
+        layer.crs, layer.data = crs, data
+        layer.resolution, layer.origin = resolution, origin
+        return layer
+
+    def __len__(self):
+        return len(self._x)
+
+    def __repr__(self):
+        storage = 'float64' if self.resolution is None else 'int32 x {}'.format(self.resolution)
+        return 'PointLayer({} points, {}, crs={})'.format(
+            len(self), storage, None if self.crs is None else self.crs.to_string())
+
+    @property
+    def nbytes(self):
+        """Bytes of the coordinates"""
+        return self._x.nbytes + self._y.nbytes
+
+    @property
+    def x(self):
+        if self.resolution is None:
+            return self._x
+        return self.origin[0] + self._x * self.resolution
+
+    @property
+    def y(self):
+        if self.resolution is None:
+            return self._y
+        return self.origin[1] + self._y * self.resolution
+
+    def take(self, rows):
+        """Layer with the points in 'rows' (positions or boolean mask)"""
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        data = None if self.data is None else self.data.iloc[rows].reset_index(drop=True)
+        return self._raw(self._x[rows], self._y[rows], self.crs, data, self.resolution,
+                         self.origin)
+
+    def __getitem__(self, rows):
+        if isinstance(rows, slice):
+            rows = np.arange(len(self))[rows]
+        return self.take(rows)
+
+    def bbox_mask(self, x_min, y_min, x_max, y_max):
+        """Boolean mask of the points inside the bbox (edges included)"""
+        if self.resolution is None:
+            return (self._x >= x_min) & (self._x <= x_max) & (self._y >= y_min) & (self._y <= y_max)
+        # Compare the stored integers, without converting the coordinates
+        qx_min, qx_max = _q_range(x_min, x_max, self.origin[0], self.resolution)
+        qy_min, qy_max = _q_range(y_min, y_max, self.origin[1], self.resolution)
+        return (self._x >= qx_min) & (self._x <= qx_max) & (self._y >= qy_min) & (self._y <= qy_max)
+
+    def within_bbox(self, x_min, y_min, x_max, y_max):
+        return self.take(self.bbox_mask(x_min, y_min, x_max, y_max))
+
+    def distance(self, x, y, method='geodesic'):
+        """
+        Distance from each point to (x, y), or to each (x[i], y[i]).
+        For geographic CRS in meters (method 'geodesic' or 'haversine'),
+        otherwise Euclidean in the units of the CRS
+        """
+        if self.crs is not None and self.crs.is_geographic:
+            x = np.broadcast_to(np.asarray(x, dtype=np.float64), (len(self),))
+            y = np.broadcast_to(np.asarray(y, dtype=np.float64), (len(self),))
+            return geo_distance(self.x, self.y, x, y, method=method)
+        return np.hypot(self.x - x, self.y - y)
+
+    def to_crs(self, crs, resolution=None, origin=None):
+        """Layer reprojected to 'crs', with float64 coordinates if resolution is None"""
+        if self.crs is None:
+            raise ValueError('The layer has no CRS')
+        crs = pyproj.CRS.from_user_input(crs)
+        x, y = _transformer(self.crs, crs).transform(self.x, self.y)
+        return PointLayer(x, y, crs=crs, data=self.data, resolution=resolution, origin=origin)
+
+    def to_geoseries(self):
+        import geopandas as gpd
+        return gpd.GeoSeries(gpd.points_from_xy(self.x, self.y), crs=self.crs)
+
+    def to_geodataframe(self):
+        import geopandas as gpd
+        data = pd.DataFrame(index=range(len(self))) if self.data is None else self.data
+        return gpd.GeoDataFrame(data, geometry=self.to_geoseries(), crs=self.crs)
+
+
+def _quantize(values, origin, resolution):
+    q = np.round((values - origin) / resolution)
+    if len(q) and (np.nanmax(np.abs(q)) > _Q_MAX or np.isnan(q).any()):
+        raise ValueError('Coordinates do not fit in int32 with resolution {}, use a larger '
+                         'resolution or resolution=None'.format(resolution))
+    return q.astype(QUANTIZED_DTYPE)
+
+
+def _q_range(v_min, v_max, origin, resolution):
+    # Range of the int32 coordinates q with v_min <= origin + q * resolution <= v_max,
+    # exact on the edges: the estimate is moved by one step where the rounding
+    # of the division differs from the decoded coordinates
+    q_min = np.ceil((v_min - origin) / resolution)
+    q_max = np.floor((v_max - origin) / resolution)
+    if origin + (q_min - 1) * resolution >= v_min:
+        q_min -= 1
+    elif origin + q_min * resolution < v_min:
+        q_min += 1
+    if origin + (q_max + 1) * resolution <= v_max:
+        q_max += 1
+    elif origin + q_max * resolution > v_max:
+        q_max -= 1
+    return q_min, q_max
+
+
+def _csv_bounds(path, x, y, chunksize, **kwargs):
+    # (x_min, y_min, x_max, y_max) of the whole file, reading only the x, y columns
+    bounds = [np.inf, np.inf, -np.inf, -np.inf]
+    for chunk in pd.read_csv(path, usecols=[x, y], chunksize=chunksize, **kwargs):
+        cx = chunk[x].to_numpy(dtype=np.float64)
+        cy = chunk[y].to_numpy(dtype=np.float64)
+        if len(cx):
+            bounds = [min(bounds[0], np.nanmin(cx)), min(bounds[1], np.nanmin(cy)),
+                      max(bounds[2], np.nanmax(cx)), max(bounds[3], np.nanmax(cy))]
+    return bounds
+
+
+def read_points_csv(path, x='x', y='y', crs=None, resolution=None, origin=None, columns=None,
+                    chunksize=1000000, **kwargs):
+    """
+    PointLayer from the columns 'x' and 'y' of a CSV file, read in chunks
+    columns: other columns kept as attributes (all if None, [] for none)
+    origin:  origin of the int32 coordinates, if None the center of the bounds
+             of the file, found with a first pass over the x, y columns
+    kwargs are passed to pd.read_csv
+    """
+    if resolution is not None and origin is None:
+        bounds = _csv_bounds(path, x, y, chunksize, **kwargs)
+        origin = ((bounds[0] + bounds[2]) / 2, (bounds[1] + bounds[3]) / 2) \
+            if np.isfinite(bounds).all() else (0.0, 0.0)
+    usecols = None if columns is None else [x, y] + list(columns)
+    xs, ys, datas = [], [], []
+    for chunk in pd.read_csv(path, usecols=usecols, chunksize=chunksize, **kwargs):
+        cx = chunk[x].to_numpy(dtype=np.float64)
+        cy = chunk[y].to_numpy(dtype=np.float64)
+        if resolution is not None:
+            cx = _quantize(cx, origin[0], resolution)
+            cy = _quantize(cy, origin[1], resolution)
+        xs.append(cx)
+        ys.append(cy)
+        if columns is None or len(columns):
+            datas.append(chunk.drop(columns=[x, y]))
+    dtype = np.float64 if resolution is None else QUANTIZED_DTYPE
+    qx = np.concatenate(xs) if xs else np.empty(0, dtype=dtype)
+    qy = np.concatenate(ys) if ys else np.empty(0, dtype=dtype)
+    data = pd.concat(datas, ignore_index=True) if datas else None
+    crs = None if crs is None else pyproj.CRS.from_user_input(crs)
+    if resolution is None:
+        return PointLayer(qx, qy, crs=crs, data=data)
+    return PointLayer._raw(qx, qy, crs, data, resolution, (float(origin[0]), float(origin[1])))
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Polygon and MultiPolygon arrays built from flat coordinate arrays
+
+The input follows the GeoArrow layout:
+ coords           (n, 2) array with the vertices of all the rings
+ ring_offsets     ring i uses coords[ring_offsets[i] : ring_offsets[i+1]]
+ polygon_offsets  polygon j uses rings polygon_offsets[j] : polygon_offsets[j+1]
+                  (first ring is the exterior, the others are holes)
+ part_offsets     multipolygon k uses polygons part_offsets[k] : part_offsets[k+1]
+With shapely >= 2 the geometries are built in one call, without Python
+objects per vertex or per ring.
+"""
+
+import numpy as np
+import geopandas as gpd
+import shapely
+from shapely.geometry import Polygon, MultiPolygon
+from pygis.output import write_layer
+
+# shapely.from_ragged_array is available from shapely 2.0
+HAS_RAGGED = hasattr(shapely, 'from_ragged_array')
+
+
+def _offsets(offsets, size, name):
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if offsets.ndim != 1 or len(offsets) < 1 or offsets[0] != 0 or offsets[-1] != size:
+        raise ValueError(name + ' must start at 0 and end at ' + str(size))
+    if np.any(np.diff(offsets) < 0):
+        raise ValueError(name + ' must be non-decreasing')
+    return offsets
+
+
+def _coords(coords, y=None):
+    if y is not None:
+        coords = np.column_stack([np.asarray(coords, dtype=np.float64),
+                                  np.asarray(y, dtype=np.float64)])
+    coords = np.ascontiguousarray(coords, dtype=np.float64)
+    if coords.ndim != 2 or coords.shape[1] not in (2, 3):
+        raise ValueError('coords must be an (n, 2) or (n, 3) array')
+    return coords
+
+
+def polygons_from_arrays(coords, ring_offsets, polygon_offsets=None, y=None, crs=None):
+    """
+    GeoSeries of Polygons. 'coords' can be an (n, 2) array, or the x array
+    with the y array given in 'y'. If polygon_offsets is None, each ring is
+    one polygon without holes
+    """
+    coords = _coords(coords, y)
+    ring_offsets = _offsets(ring_offsets, len(coords), 'ring_offsets')
+    n_rings = len(ring_offsets) - 1
+    if polygon_offsets is None:
+        polygon_offsets = np.arange(n_rings + 1, dtype=np.int64)
+    polygon_offsets = _offsets(polygon_offsets, n_rings, 'polygon_offsets')
+
+    if HAS_RAGGED:
+        geoms = shapely.from_ragged_array(shapely.GeometryType.POLYGON, coords,
+                                          (ring_offsets, polygon_offsets))
+    else:
+        geoms = _polygons(coords, ring_offsets, polygon_offsets)
+    return gpd.GeoSeries(geoms, crs=crs)
+
+
+def multipolygons_from_arrays(coords, ring_offsets, polygon_offsets, part_offsets, y=None, crs=None):
+    """GeoSeries of MultiPolygons, see polygons_from_arrays()"""
+    coords = _coords(coords, y)
+    ring_offsets = _offsets(ring_offsets, len(coords), 'ring_offsets')
+    polygon_offsets = _offsets(polygon_offsets, len(ring_offsets) - 1, 'polygon_offsets')
+    part_offsets = _offsets(part_offsets, len(polygon_offsets) - 1, 'part_offsets')
+
+    if HAS_RAGGED:
+        geoms = shapely.from_ragged_array(shapely.GeometryType.MULTIPOLYGON, coords,
+                                          (ring_offsets, polygon_offsets, part_offsets))
+    else:
+        polygons = _polygons(coords, ring_offsets, polygon_offsets)
+        geoms = np.empty(len(part_offsets) - 1, dtype=object)
+        for k in range(len(geoms)):
+            geoms[k] = MultiPolygon(list(polygons[part_offsets[k] : part_offsets[k + 1]]))
+    return gpd.GeoSeries(geoms, crs=crs)
+
+
+def _polygons(coords, ring_offsets, polygon_offsets):
+    # Fallback for shapely < 2: one Polygon per polygon, built from
+    # slices of the coordinate array (no Python objects per vertex)
+    geoms = np.empty(len(polygon_offsets) - 1, dtype=object)
+    for j in range(len(geoms)):
+        r0, r1 = polygon_offsets[j], polygon_offsets[j + 1]
+        if r0 == r1:
+            geoms[j] = Polygon()
+            continue
+        shell = coords[ring_offsets[r0] : ring_offsets[r0 + 1]]
+        holes = [coords[ring_offsets[r] : ring_offsets[r + 1]] for r in range(r0 + 1, r1)]
+        geoms[j] = Polygon(shell, holes)
+    return geoms
+
+
+def write_polygons(path, geometries, crs=None, data=None, **kwargs):
+    """
+    Write the geometries, with the columns in the dict/DataFrame 'data',
+    to GeoPackage (.gpkg) or GeoParquet (.parquet), see output.write_layer()
+    """
+    gdf = gpd.GeoDataFrame(data=data, geometry=geometries, crs=crs)
+    write_layer(gdf, path, **kwargs)
+    return gdf
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Population surface stored out-of-core as tiles of grid cells
+
+Each cell of a population grid (e.g. Vaestotietoruudukko_2015) is kept as
+its centroid coordinates and its population. The cells are partitioned in
+square spatial tiles, one binary file per tile, and an index (tiles.json)
+has the bounds and number of cells of each tile.
+Aggregations such as the population within a radius of each facility read
+the tiles one at a time, and only the tiles whose bounds intersect the query.
+
+Building the surface reads the source in chunks of rows, so the full grid
+is never in memory. The corners of quadrilateral cells are kept with the
+centroids, for the exact 'within' queries.
+"""
+
+import os
+import json
+import numpy as np
+import geopandas as gpd
+from shapely.geometry import Point, Polygon
+
+CELL_DTYPE = np.dtype([('x', 'f8'), ('y', 'f8'), ('population', 'f8'), ('corners', 'f8', (4, 2))])
+# Bump when the tile format changes, open_surface() rebuilds older surfaces
+SURFACE_VERSION = 2
+# Segments per quarter circle of the query buffers, as in GeoSeries.buffer()
+BUFFER_RESOLUTION = 16
+
+
+def _tile_path(surface_dir, tx, ty):
+    return os.path.join(surface_dir, 'tile_{}_{}.bin'.format(tx, ty))
+
+
+def _corners(geoms):
+    # (n, 4, 2) corners of quadrilateral cells, NaN for other geometries
+    corners = np.full((len(geoms), 4, 2), np.nan)
+    for ix, geom in enumerate(geoms):
+        if geom is not None and geom.geom_type == 'Polygon':
+            coords = np.asarray(geom.exterior.coords)
+            if len(coords) == 5:
+                corners[ix] = coords[:4, :2]
+    return corners
+
+
+def _source_stat(source):
+    # [path, size, mtime] of the file of 'source', None for a GeoDataFrame
+    if isinstance(source, gpd.GeoDataFrame):
+        return None
+    path = str(source)
+    if path.startswith('zip://'):
+        path = path[len('zip://'):].split('!')[0]
+    stat = os.stat(path)
+    return [os.path.abspath(str(source)), stat.st_size, stat.st_mtime_ns]
+
+
+def build_surface(source, surface_dir, crs, column='population', tile_size=10000.0,
+                  chunksize=500000):
+    """
+    Write the population surface of 'source' in 'surface_dir'
+    source:    path readable by geopandas (shapefile, zip://, GeoPackage)
+               or a GeoDataFrame with polygon cells
+    crs:       metric CRS of the surface, e.g. 3035
+    column:    column with the population of each cell
+    tile_size: side of the tiles in meters
+    """
+    os.makedirs(surface_dir, exist_ok=True)
+    for name in os.listdir(surface_dir):
+        if name.startswith('tile_') and name.endswith('.bin'):
+            os.remove(os.path.join(surface_dir, name))
+
+    tiles = {}
+    cell_sizes = []
+    quadrilateral = True
+    start = 0
+    while True:
+        if isinstance(source, gpd.GeoDataFrame):
+            chunk = source.iloc[start : start + chunksize]
+        else:
+            chunk = gpd.read_file(source, rows=slice(start, start + chunksize))
+        if len(chunk) == 0:
+            break
+        chunk = chunk.to_crs(crs)
+        centroids = chunk.geometry.centroid
+        cells = np.empty(len(chunk), dtype=CELL_DTYPE)
+        cells['x'] = centroids.x.to_numpy()
+        cells['y'] = centroids.y.to_numpy()
+        cells['population'] = chunk[column].to_numpy(dtype=np.float64)
+        cells['corners'] = _corners(chunk.geometry)
+        quadrilateral = quadrilateral and not np.isnan(cells['corners']).any()
+        cell_sizes.append(np.sqrt(chunk.geometry.area.to_numpy()))
+
+        # Append the cells to the file of their tile
+        tx = np.floor(cells['x'] / tile_size).astype(np.int64)
+        ty = np.floor(cells['y'] / tile_size).astype(np.int64)
+        keys, inverse = np.unique(np.stack([tx, ty], axis=1), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(keys) + 1))
+        for k, (kx, ky) in enumerate(keys):
+            part = cells[order[bounds[k] : bounds[k + 1]]]
+            with open(_tile_path(surface_dir, kx, ky), 'ab') as fout:
+                part.tofile(fout)
+            key = '{}_{}'.format(kx, ky)
+            tile = tiles.setdefault(key, {'tx': int(kx), 'ty': int(ky), 'n_cells': 0,
+                                          'population': 0.0,
+                                          'bounds': [np.inf, np.inf, -np.inf, -np.inf]})
+            tile['n_cells'] += len(part)
+            tile['population'] += float(part['population'].sum())
+            tile['bounds'] = [min(tile['bounds'][0], float(part['x'].min())),
+                              min(tile['bounds'][1], float(part['y'].min())),
+                              max(tile['bounds'][2], float(part['x'].max())),
+                              max(tile['bounds'][3], float(part['y'].max()))]
+        start += len(chunk)
+        if isinstance(source, gpd.GeoDataFrame) and start >= len(source):
+            break
+
+    cell_size = float(np.median(np.concatenate(cell_sizes))) if cell_sizes else 0.0
+    meta = {'version': SURFACE_VERSION, 'crs': gpd.GeoSeries([], crs=crs).crs.to_wkt(),
+            'tile_size': tile_size, 'cell_size': cell_size, 'n_cells': start,
+            'quadrilateral': quadrilateral, 'source': _source_stat(source),
+            'tiles': list(tiles.values())}
+    with open(os.path.join(surface_dir, 'tiles.json'), 'w') as fout:
+        json.dump(meta, fout)
+    return PopulationSurface(surface_dir)
+
+
+class PopulationSurface:
+    def __init__(self, surface_dir):
+        self.surface_dir = surface_dir
+        with open(os.path.join(surface_dir, 'tiles.json')) as fin:
+            self.meta = json.load(fin)
+        self.crs = self.meta['crs']
+        self.cell_size = self.meta['cell_size']
+        self.tiles = self.meta['tiles']
+        self.tile_bounds = np.array([tile['bounds'] for tile in self.tiles]).reshape(-1, 4)
+
+    def __len__(self):
+        return self.meta['n_cells']
+
+    def read_tile(self, ix):
+        tile = self.tiles[ix]
+        return np.fromfile(_tile_path(self.surface_dir, tile['tx'], tile['ty']), dtype=CELL_DTYPE)
+
+    def tiles_intersecting(self, bounds):
+        """Indices of the tiles whose bounds intersect bounds = (x_min, y_min, x_max, y_max)"""
+        b = self.tile_bounds
+        hit = ((b[:, 0] <= bounds[2]) & (b[:, 2] >= bounds[0]) &
+               (b[:, 1] <= bounds[3]) & (b[:, 3] >= bounds[1]))
+        return np.flatnonzero(hit)
+
+    def sum_within_radius(self, x, y, radius, cells='centroid'):
+        """
+        Population within 'radius' of each point (x, y), in the CRS of the surface
+        cells: 'centroid' counts the cells whose centroid is within the radius,
+               'within' only the cells that are completely within the buffer
+               of the point (as gpd.sjoin(pop, buffers, predicate='within')
+               with buffers = points.buffer(radius)), needs quadrilateral cells
+        """
+        if cells not in ('centroid', 'within'):
+            raise ValueError("cells must be 'centroid' or 'within'")
+        if cells == 'within' and not self.meta.get('quadrilateral', False):
+            raise ValueError("cells='within' needs a surface of quadrilateral cells")
+        x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+        y = np.atleast_1d(np.asarray(y, dtype=np.float64))
+        totals = np.zeros(len(x))
+        if len(x) == 0 or len(self.tiles) == 0:
+            return totals
+        b = self.tile_bounds
+        # Tiles intersecting the bbox of each query circle
+        hits = ((b[:, None, 0] <= x + radius) & (b[:, None, 2] >= x - radius) &
+                (b[:, None, 1] <= y + radius) & (b[:, None, 3] >= y - radius))
+        for ix in np.flatnonzero(hits.any(axis=1)):
+            tile = self.read_tile(ix)
+            for q in np.flatnonzero(hits[ix]):
+                if cells == 'centroid':
+                    dx = tile['x'] - x[q]
+                    dy = tile['y'] - y[q]
+                    totals[q] += tile['population'][dx * dx + dy * dy <= radius ** 2].sum()
+                else:
+                    totals[q] += tile['population'][self._within(tile, x[q], y[q], radius)].sum()
+        return totals
+
+    @staticmethod
+    def _within(tile, x, y, radius):
+        # Cells of the tile within the polygon buffer of (x, y)
+        dx = tile['corners'][:, :, 0] - x
+        dy = tile['corners'][:, :, 1] - y
+        far = np.sqrt((dx * dx + dy * dy).max(axis=1))
+        # The buffer has the vertices on the circle, the cells with all the
+        # corners within its inscribed circle are within it, the cells with a
+        # corner out of the circle are not. Only the ones in between are tested
+        inner = radius * np.cos(np.pi / (4 * BUFFER_RESOLUTION))
+        within = far <= inner
+        ring = np.flatnonzero((far > inner) & (far <= radius))
+        if len(ring):
+            buffer = Point(x, y).buffer(radius, BUFFER_RESOLUTION)
+            within[ring] = [Polygon(tile['corners'][k]).within(buffer) for k in ring]
+        return within
+
+    def sum_within_polygons(self, polygons):
+        """
+        Population of the cells whose centroid is within each polygon
+        polygons: GeoSeries/GeoDataFrame, reprojected to the CRS of the surface
+        """
+        polygons = polygons.to_crs(self.crs).geometry
+        totals = np.zeros(len(polygons))
+        poly_bounds = polygons.bounds.to_numpy()
+        for ix in range(len(self.tiles)):
+            b = self.tile_bounds[ix]
+            hit = np.flatnonzero((poly_bounds[:, 0] <= b[2]) & (poly_bounds[:, 2] >= b[0]) &
+                                 (poly_bounds[:, 1] <= b[3]) & (poly_bounds[:, 3] >= b[1]))
+            if len(hit) == 0:
+                continue
+            tile = self.read_tile(ix)
+            points = gpd.GeoSeries(gpd.points_from_xy(tile['x'], tile['y']))
+            for q in hit:
+                totals[q] += tile['population'][points.within(polygons.iloc[q]).to_numpy()].sum()
+        return totals
+
+
+def open_surface(source, surface_dir, crs, rebuild=False, **kwargs):
+    """
+    Open the surface in 'surface_dir', building it from 'source' if missing,
+    written by an older version or if the source file changed (size / mtime).
+    A GeoDataFrame source is not checked, use rebuild=True after changing it
+    """
+    if not rebuild and os.path.exists(os.path.join(surface_dir, 'tiles.json')):
+        surface = PopulationSurface(surface_dir)
+        if (surface.meta.get('version') == SURFACE_VERSION and
+                surface.meta.get('source') == _source_stat(source)):
+            return surface
+    return build_surface(source, surface_dir, crs, **kwargs)
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Spatial-temporal index for point logs such as southafrica_posts.csv
+(columns lat, lon, timestamp, userid)
+
+Building the index:
+ - Points are grouped in time buckets (1 day by default) and, within each
+   bucket, sorted along a Hilbert curve over the extent of the data
+ - The sorted columns are saved as .npy files in a directory next to the
+   data (southafrica_posts.csv -> southafrica_posts.csv.idx/)
+
+Querying the index:
+ - Columns are memory-mapped, only the pages of the matching rows are read
+ - A time window selects a range of buckets, and a bbox is decomposed into
+   quadtree cells, each cell is a contiguous range of Hilbert keys
+ - A user query uses a row order sorted by userid
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+INDEX_VERSION = 1
+# Bits per axis of the Hilbert curve, the key fits in an uint64
+HILBERT_ORDER = 16
+# Columns stored in the index, in the sort order of the index
+COLUMNS = ['lon', 'lat', 'time', 'userid', 'row', 'hkey', 'tbucket']
+
+
+def hilbert_key(ix, iy, order=HILBERT_ORDER):
+    """Position along the Hilbert curve of integer cells (ix, iy) in [0, 2**order)"""
+    x = np.array(ix, dtype=np.uint64, copy=True)
+    y = np.array(iy, dtype=np.uint64, copy=True)
+    key = np.zeros(x.shape, dtype=np.uint64)
+    n = np.uint64(1 << order)
+    s = n >> np.uint64(1)
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        key += s * s * ((np.uint64(3) * rx) ^ ry).astype(np.uint64)
+        # Rotate the quadrant
+        flip = ~ry & rx
+        x = np.where(flip, n - np.uint64(1) - x, x)
+        y = np.where(flip, n - np.uint64(1) - y, y)
+        swap = ~ry
+        x, y = np.where(swap, y, x), np.where(swap, x, y)
+        s >>= np.uint64(1)
+    return key
+
+
+def index_path(data_path):
+    return str(data_path) + '.idx'
+
+
+def build_index(data_path, index_dir=None, time_bucket='1D', time_format='%Y-%m-%d %H:%M',
+                order=HILBERT_ORDER):
+    """
+    Build the index for the CSV file 'data_path'
+    time_bucket: pandas offset alias with the duration of the time buckets
+    time_format: strftime format of the timestamp column
+    """
+    if index_dir is None:
+        index_dir = index_path(data_path)
+    posts = pd.read_csv(data_path, usecols=['lat', 'lon', 'timestamp', 'userid'],
+                        dtype={'lat': np.float64, 'lon': np.float64, 'userid': np.int64})
+    lon = posts['lon'].to_numpy()
+    lat = posts['lat'].to_numpy()
+    time = parse_times(posts['timestamp'], time_format)
+    userid = posts['userid'].to_numpy()
+    del posts
+
+    # Extent of the data, slightly padded so that the max values are inside
+    bounds = [float(lon.min()), float(lat.min()), float(lon.max()), float(lat.max())]
+    bounds[2] += 1e-9 * max(1.0, abs(bounds[2]))
+    bounds[3] += 1e-9 * max(1.0, abs(bounds[3]))
+    ix, iy = _cells(lon, lat, bounds, order)
+    hkey = hilbert_key(ix, iy, order)
+    bucket_seconds = int(pd.Timedelta(time_bucket).total_seconds())
+    tbucket = time // bucket_seconds
+
+    # Sort by time bucket, then along the Hilbert curve
+    sort = np.lexsort((hkey, tbucket))
+    columns = {'lon': lon, 'lat': lat, 'time': time, 'userid': userid,
+               'row': np.arange(len(lon), dtype=np.int64), 'hkey': hkey, 'tbucket': tbucket}
+    os.makedirs(index_dir, exist_ok=True)
+    for name in COLUMNS:
+        np.save(os.path.join(index_dir, name + '.npy'), columns[name][sort])
+
+    # Rows of the index sorted by userid, and start of each user
+    sorted_users = userid[sort]
+    by_user = np.argsort(sorted_users, kind='stable')
+    users, user_starts = np.unique(sorted_users[by_user], return_index=True)
+    np.save(os.path.join(index_dir, 'by_user.npy'), by_user)
+    np.save(os.path.join(index_dir, 'users.npy'), users)
+    np.save(os.path.join(index_dir, 'user_starts.npy'), user_starts)
+
+    meta = {'version': INDEX_VERSION, 'n_rows': int(len(lon)), 'bounds': bounds,
+            'order': order, 'bucket_seconds': bucket_seconds,
+            'source': os.path.basename(str(data_path)),
+            'source_mtime': os.path.getmtime(data_path)}
+    with open(os.path.join(index_dir, 'meta.json'), 'w') as fout:
+        json.dump(meta, fout, indent=2)
+    return PostIndex(index_dir)
+
+
+def open_index(data_path, rebuild=False, **kwargs):
+    """
+    Open the index next to 'data_path', building it if missing or outdated
+    kwargs are passed to build_index()
+    """
+    index_dir = index_path(data_path)
+    meta_path = os.path.join(index_dir, 'meta.json')
+    if not rebuild and os.path.exists(meta_path):
+        with open(meta_path) as fin:
+            meta = json.load(fin)
+        if (meta.get('version') == INDEX_VERSION and
+                meta.get('source_mtime') == os.path.getmtime(data_path)):
+            return PostIndex(index_dir)
+    return build_index(data_path, index_dir, **kwargs)
+
+
+class PostIndex:
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'meta.json')) as fin:
+            self.meta = json.load(fin)
+        # Memory-mapped columns
+        for name in COLUMNS + ['by_user', 'users', 'user_starts']:
+            setattr(self, name, np.load(os.path.join(index_dir, name + '.npy'), mmap_mode='r'))
+
+    def __len__(self):
+        return self.meta['n_rows']
+
+    def query(self, bbox=None, start=None, end=None, users=None, max_ranges=256):
+        """
+        Posts inside bbox = (lon_min, lat_min, lon_max, lat_max), with
+        start <= timestamp < end, and from the given users
+        Any of the conditions can be None. Returns a DataFrame with the
+        columns lat, lon, timestamp, userid and the original row as index
+        """
+        t_start = None if start is None else _seconds(start)
+        t_end = None if end is None else _seconds(end)
+
+        if users is not None:
+            rows = self._user_rows(users)
+        else:
+            rows = self._range_rows(bbox, t_start, t_end, max_ranges)
+
+        # Exact filter on the candidate rows
+        lon = self.lon[rows]
+        lat = self.lat[rows]
+        time = self.time[rows]
+        keep = np.ones(len(rows), dtype=bool)
+        if bbox is not None:
+            keep &= (lon >= bbox[0]) & (lat >= bbox[1]) & (lon <= bbox[2]) & (lat <= bbox[3])
+        if t_start is not None:
+            keep &= time >= t_start
+        if t_end is not None:
+            keep &= time < t_end
+        rows = rows[keep]
+
+        result = pd.DataFrame({'lat': lat[keep], 'lon': lon[keep],
+                               'timestamp': time[keep].astype('datetime64[s]'),
+                               'userid': self.userid[rows]},
+                              index=pd.Index(self.row[rows], name='row'))
+        return result.sort_index()
+
+    def _user_rows(self, users):
+        users = np.atleast_1d(np.asarray(users, dtype=np.int64))
+        ix = np.searchsorted(self.users, users)
+        found = (ix < len(self.users))
+        found[found] = self.users[ix[found]] == users[found]
+        ends = np.append(self.user_starts[1:], len(self))
+        chunks = [self.by_user[self.user_starts[i] : ends[i]] for i in ix[found]]
+        if not chunks:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(chunks))
+
+    def _range_rows(self, bbox, t_start, t_end, max_ranges):
+        # Rows of the time buckets in [t_start, t_end)
+        bucket_seconds = self.meta['bucket_seconds']
+        row_lo, row_hi = 0, len(self)
+        if t_start is not None:
+            row_lo = int(np.searchsorted(self.tbucket, t_start // bucket_seconds, side='left'))
+        if t_end is not None:
+            row_hi = int(np.searchsorted(self.tbucket, (t_end - 1) // bucket_seconds, side='right'))
+        if bbox is None or row_lo >= row_hi:
+            return np.arange(row_lo, row_hi, dtype=np.int64)
+
+        key_ranges = self._key_ranges(bbox, max_ranges)
+        if len(key_ranges) == 0:
+            return np.empty(0, dtype=np.int64)
+        # Hilbert keys are sorted within each bucket
+        slices = []
+        lo = row_lo
+        while lo < row_hi:
+            hi = int(np.searchsorted(self.tbucket[lo:row_hi], self.tbucket[lo], side='right')) + lo
+            keys = self.hkey[lo:hi]
+            starts = np.searchsorted(keys, key_ranges[:, 0], side='left') + lo
+            stops = np.searchsorted(keys, key_ranges[:, 1], side='left') + lo
+            for a, b in zip(starts, stops):
+                if a < b:
+                    slices.append(np.arange(a, b, dtype=np.int64))
+            lo = hi
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(slices)
+
+    def _key_ranges(self, bbox, max_ranges):
+        # Quadtree cells covering bbox, as sorted [start, stop) Hilbert key ranges
+        order = self.meta['order']
+        bounds = self.meta['bounds']
+        x0, y0 = _cells(max(bbox[0], bounds[0]), max(bbox[1], bounds[1]), bounds, order)
+        x1, y1 = _cells(min(bbox[2], bounds[2]), min(bbox[3], bounds[3]), bounds, order)
+        x0, y0, x1, y1 = int(x0), int(y0), int(x1), int(y1)
+        if bbox[0] > bounds[2] or bbox[2] < bounds[0] or bbox[1] > bounds[3] or bbox[3] < bounds[1]:
+            return np.empty((0, 2), dtype=np.uint64)
+
+        ranges = []
+        cells = [(0, 0, order)]  # (cx, cy, level) with cell size 2**level
+        while cells:
+            # Split partial cells while the number of ranges stays small
+            split = len(ranges) + 4 * len(cells) <= max_ranges
+            next_cells = []
+            for cx, cy, level in cells:
+                size = 1 << level
+                if cx > x1 or cy > y1 or cx + size - 1 < x0 or cy + size - 1 < y0:
+                    continue
+                inside = cx >= x0 and cy >= y0 and cx + size - 1 <= x1 and cy + size - 1 <= y1
+                if inside or level == 0 or not split:
+                    # An aligned cell is a contiguous range of the Hilbert curve
+                    start = int(hilbert_key(cx, cy, order)) & ~((1 << (2 * level)) - 1)
+                    ranges.append((start, start + (1 << (2 * level))))
+                else:
+                    half = size >> 1
+                    next_cells += [(cx, cy, level - 1), (cx + half, cy, level - 1),
+                                   (cx, cy + half, level - 1), (cx + half, cy + half, level - 1)]
+            cells = next_cells
+
+        # Sort and merge adjacent ranges
+        ranges.sort()
+        merged = [list(ranges[0])]
+        for start, stop in ranges[1:]:
+            if start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], stop)
+            else:
+                merged.append([start, stop])
+        return np.array(merged, dtype=np.uint64)
+
+
+def _cells(lon, lat, bounds, order):
+    # Integer cell of (lon, lat) in a 2**order x 2**order grid over bounds
+    n = 1 << order
+    fx = (np.asarray(lon, dtype=np.float64) - bounds[0]) / (bounds[2] - bounds[0])
+    fy = (np.asarray(lat, dtype=np.float64) - bounds[1]) / (bounds[3] - bounds[1])
+    ix = np.clip(np.floor(fx * n), 0, n - 1).astype(np.uint64)
+    iy = np.clip(np.floor(fy * n), 0, n - 1).astype(np.uint64)
+    return ix, iy
+
+
+def parse_times(timestamps, time_format='%Y-%m-%d %H:%M'):
+    """
+    Seconds since epoch for a Series of timestamp strings
+    The posts have invalid dates such as 2015-02-30, these are rolled over
+    to the next month (2015-03-02) instead of dropped
+    """
+    times = pd.to_datetime(timestamps, format=time_format, errors='coerce')
+    invalid = times.isna().to_numpy()
+    times = times.to_numpy().astype('datetime64[s]')
+    if invalid.any():
+        parts = timestamps[invalid].str.extract(r'(\d+)-(\d+)-(\d+)[ T]?(\d+)?:?(\d+)?:?(\d+)?')
+        parts = parts.fillna(0).astype(np.int64).to_numpy()
+        months = (parts[:, 0] - 1970) * 12 + parts[:, 1] - 1
+        times[invalid] = (months.astype('datetime64[M]').astype('datetime64[s]') +
+                          ((parts[:, 2] - 1) * 86400 + parts[:, 3] * 3600 +
+                           parts[:, 4] * 60 + parts[:, 5]).astype('timedelta64[s]'))
+    return times.astype(np.int64)
+
+
+def _seconds(timestamp):
+    # Seconds since epoch for a timestamp string or datetime
+    return int(pd.Timestamp(timestamp).to_datetime64().astype('datetime64[s]').astype(np.int64))
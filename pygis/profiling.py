@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Timing and profiling of named stages of a pipeline
+
+For each stage the profiler records wall time, CPU time, memory and the
+number of items processed. Stages can be nested, the nesting is kept per
+thread, so stages timed from several threads have the depth and parent of
+their own thread (tid in the trace).
+
+profiler = Profiler()
+with profiler.stage('geocoding') as st:
+    ...
+    st.items = len(data_gdf)
+
+@profiler.stage('overlay')     # as decorator
+def remove_water(grid): ...
+
+profiler.start('isochrones')   # or start/stop, for top-level scripts
+...
+profiler.stop(items=len(grid))
+
+profiler.summary()                        # table with all the stages
+profiler.to_chrome_trace('trace.json')    # open in chrome://tracing or Perfetto
+
+Memory:
+ peak_rss_mb    peak RSS of the process at the end of the stage
+ rss_delta_mb   change of RSS during the stage
+ peak_alloc_mb  peak Python/NumPy allocations during the stage, only
+                with Profiler(trace_memory=True) (tracemalloc, slower)
+
+Capture of a stage with a profiler, Profiler(capture={'stage': 'cprofile'}):
+ 'cprofile'  cProfile stats saved as <capture_dir>/<stage>.prof (pstats, snakeviz)
+ 'py-spy'    py-spy records the process during the stage, saved as
+             <capture_dir>/<stage>.speedscope.json (needs py-spy installed)
+"""
+
+import os
+import sys
+import time
+import json
+import shutil
+import signal
+import warnings
+import threading
+import functools
+import subprocess
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def _rss_mb():
+    # Current RSS of the process in MB
+    try:
+        with open('/proc/self/statm') as fin:
+            pages = int(fin.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        return _peak_rss_mb()
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return maxrss / (1024 * 1024) if sys.platform == 'darwin' else maxrss / 1024
+
+
+class StageRecord:
+    def __init__(self, name, depth):
+        self.name = name
+        self.depth = depth
+        self.items = None
+        self.start = None
+        self.wall_time = None
+        self.cpu_time = None
+        self.peak_rss_mb = None
+        self.rss_delta_mb = None
+        self.peak_alloc_mb = None
+        self.thread = threading.get_ident()
+        self._cpu0 = None
+        self._rss0 = None
+        self._alloc0 = None
+        self._peak_alloc = 0
+        self._capture = None
+
+    def as_dict(self):
+        return {'name': self.name, 'depth': self.depth, 'items': self.items,
+                'wall_time': self.wall_time, 'cpu_time': self.cpu_time,
+                'peak_rss_mb': self.peak_rss_mb, 'rss_delta_mb': self.rss_delta_mb,
+                'peak_alloc_mb': self.peak_alloc_mb}
+
+
+class Profiler:
+    def __init__(self, trace_memory=False, capture=None, capture_dir='./profiles'):
+        self.trace_memory = trace_memory
+        self.capture = {} if capture is None else dict(capture)
+        self.capture_dir = capture_dir
+        self.records = []
+        # Open stages of each thread, so stages timed from several threads
+        # get the depth and parent of their own thread
+        self._local = threading.local()
+        self._t0 = time.perf_counter()
+
+    @property
+    def _stack(self):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    # Stages
+    def start(self, name):
+        record = StageRecord(name, len(self._stack))
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            current, peak = tracemalloc.get_traced_memory()
+            # The peak so far belongs to the enclosing stage
+            if self._stack:
+                self._stack[-1]._peak_alloc = max(self._stack[-1]._peak_alloc, peak)
+            tracemalloc.reset_peak()
+            record._alloc0 = current
+        record._capture = self._start_capture(name)
+        record._rss0 = _rss_mb()
+        record._cpu0 = time.process_time()
+        record.start = time.perf_counter()
+        self._stack.append(record)
+        self.records.append(record)
+        return record
+
+    def stop(self, items=None):
+        record = self._stack.pop()
+        record.wall_time = time.perf_counter() - record.start
+        record.cpu_time = time.process_time() - record._cpu0
+        self._stop_capture(record)
+        rss = _rss_mb()
+        record.rss_delta_mb = None if rss is None else rss - record._rss0
+        record.peak_rss_mb = _peak_rss_mb()
+        if items is not None:
+            record.items = items
+        if self.trace_memory and tracemalloc.is_tracing():
+            peak = max(record._peak_alloc, tracemalloc.get_traced_memory()[1])
+            record.peak_alloc_mb = (peak - record._alloc0) / (1024 * 1024)
+            if self._stack:
+                self._stack[-1]._peak_alloc = max(self._stack[-1]._peak_alloc, peak)
+            tracemalloc.reset_peak()
+        return record
+
+    def stage(self, name):
+        """Context manager and decorator for a named stage"""
+        return _Stage(self, name)
+
+    # Capture with cProfile or py-spy
+    def _start_capture(self, name):
+        tool = self.capture.get(name)
+        if tool is None:
+            return None
+        os.makedirs(self.capture_dir, exist_ok=True)
+        if tool == 'cprofile':
+            import cProfile
+            profile = cProfile.Profile()
+            profile.enable()
+            return ('cprofile', profile)
+        if tool == 'py-spy':
+            if shutil.which('py-spy') is None:
+                warnings.warn('py-spy not found, stage ' + name + ' is not captured')
+                return None
+            path = os.path.join(self.capture_dir, name + '.speedscope.json')
+            process = subprocess.Popen(['py-spy', 'record', '--format', 'speedscope',
+                                        '--output', path, '--pid', str(os.getpid())],
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return ('py-spy', process)
+        raise ValueError('Unknown capture tool: ' + str(tool))
+
+    def _stop_capture(self, record):
+        if record._capture is None:
+            return
+        tool, handle = record._capture
+        if tool == 'cprofile':
+            handle.disable()
+            handle.dump_stats(os.path.join(self.capture_dir, record.name + '.prof'))
+        else:
+            # py-spy writes its output when interrupted
+            handle.send_signal(signal.SIGINT)
+            handle.wait()
+        record._capture = None
+
+    # Reports
+    def as_dicts(self):
+        return [record.as_dict() for record in self.records if record.wall_time is not None]
+
+    def summary(self, file=None):
+        """Print a table with the stages, in the order they started"""
+        header = '{:<32} {:>10} {:>10} {:>10} {:>12} {:>10} {:>10} {:>10}'.format(
+            'stage', 'wall (s)', 'cpu (s)', 'items', 'items/s', 'peak MB', 'delta MB', 'alloc MB')
+        lines = [header, '-' * len(header)]
+        for record in self.records:
+            if record.wall_time is None:
+                continue
+            rate = ''
+            if record.items is not None and record.wall_time > 0:
+                rate = '{:.1f}'.format(record.items / record.wall_time)
+            lines.append('{:<32} {:>10.3f} {:>10.3f} {:>10} {:>12} {:>10} {:>10} {:>10}'.format(
+                '  ' * record.depth + record.name, record.wall_time, record.cpu_time,
+                '' if record.items is None else record.items, rate,
+                _fmt(record.peak_rss_mb), _fmt(record.rss_delta_mb), _fmt(record.peak_alloc_mb)))
+        print('\n'.join(lines), file=file)
+
+    def to_chrome_trace(self, path):
+        """Save the stages as Chrome trace JSON (chrome://tracing, Perfetto)"""
+        pid = os.getpid()
+        events = []
+        for record in self.records:
+            if record.wall_time is None:
+                continue
+            args = {k: v for k, v in record.as_dict().items()
+                    if k not in ('name', 'depth', 'wall_time') and v is not None}
+            events.append({'name': record.name, 'cat': 'stage', 'ph': 'X',
+                           'ts': (record.start - self._t0) * 1e6, 'dur': record.wall_time * 1e6,
+                           'pid': pid, 'tid': record.thread, 'args': args})
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        with open(path, 'w') as fout:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fout)
+        return path
+
+
+def _fmt(value):
+    return '' if value is None else '{:.1f}'.format(value)
+
+
+class _Stage:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        return self.profiler.start(self.name)
+
+    def __exit__(self, *exc):
+        self.profiler.stop()
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _Stage(self.profiler, self.name):
+                return func(*args, **kwargs)
+        return wrapper
+
+
+# Profiler shared by the modules of a run
+profiler = Profiler()
+stage = profiler.stage
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+NumPy arrays in multiprocessing.shared_memory, to pass large buffers to
+worker processes without pickling them
+
+The parent process shares an array and sends its small 'spec' (name,
+shape, dtype) to the workers, which attach to the same memory (zero-copy).
+
+shared = SharedArray.from_array(coords)
+pool.map(worker, [(shared.spec, start, stop) for ...])
+shared.unlink()                         # when the workers are done
+
+def worker(spec, start, stop):
+    coords, shm = attach(spec)
+    ...
+    shm.close()
+
+map_slices() does all of the above for computations over rows: the inputs
+and the result are shared arrays, each task only sends the specs and its
+(start, stop) range, so the cost per task does not depend on the rows.
+
+def distance_slice(inputs, out, start, stop):
+    out[start:stop] = np.hypot(inputs['x'][start:stop], inputs['y'][start:stop])
+
+dist = map_slices(distance_slice, {'x': x, 'y': y}, (len(x),), np.float64)
+"""
+
+import os
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from multiprocessing import shared_memory
+
+
+class SharedArray:
+    """Array owned by this process and backed by shared memory"""
+
+    def __init__(self, shape, dtype):
+        dtype = np.dtype(dtype)
+        size = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        self.array = np.ndarray(shape, dtype=dtype, buffer=self.shm.buf)
+
+    @classmethod
+    def from_array(cls, array):
+        array = np.asarray(array)
+        shared = cls(array.shape, array.dtype)
+        shared.array[...] = array
+        return shared
+
+    @property
+    def spec(self):
+        # Picklable description used by attach()
+        return (self.shm.name, self.array.shape, self.array.dtype.str)
+
+    def unlink(self):
+        """Release the memory, the array can not be used afterwards"""
+        self.array = None
+        self.shm.close()
+        self.shm.unlink()
+
+
+def attach(spec):
+    """(array, shm) for the spec of a SharedArray, call shm.close() when done"""
+    name, shape, dtype = spec
+    # Worker processes share the resource tracker of the parent, so the
+    # memory is only unlinked by the owner
+    shm = shared_memory.SharedMemory(name=name)
+    return np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf), shm
+
+
+def map_tasks(worker, tasks, processes=None):
+    """
+    [worker(task) for task in tasks] in worker processes started with 'fork',
+    or in this process if 'fork' is not available (Windows)
+    """
+    processes = (os.cpu_count() or 1) if processes is None else processes
+    if processes == 1 or len(tasks) <= 1 or 'fork' not in mp.get_all_start_methods():
+        return [worker(task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=processes, mp_context=mp.get_context('fork')) as pool:
+        return list(pool.map(worker, tasks))
+
+
+def _slice_task(task):
+    # Worker: attach the inputs and the result, compute one slice
+    func, specs, out_spec, start, stop, args = task
+    attached = {name: attach(spec) for name, spec in specs.items()}
+    out, out_shm = attach(out_spec)
+    try:
+        func({name: array for name, (array, _) in attached.items()}, out, start, stop, *args)
+    finally:
+        del out
+        attached = {name: shm for name, (_, shm) in attached.items()}
+        for shm in attached.values():
+            shm.close()
+        out_shm.close()
+
+
+def map_slices(func, inputs, out_shape, out_dtype, args=(), n_rows=None, processes=None,
+               chunksize=None, fill=0):
+    """
+    Result array of func(inputs, out, start, stop, *args) over slices of rows
+    inputs:    dict name -> array, copied once to shared memory
+    out_shape: shape of the result, rows along the first axis
+    func:      top-level function that writes out[start:stop]
+    args:      small picklable arguments, sent with each task
+    """
+    n_rows = out_shape[0] if n_rows is None else n_rows
+    processes = (os.cpu_count() or 1) if processes is None else processes
+    if chunksize is None:
+        chunksize = max(1, -(-n_rows // (4 * processes)))
+    shared = {name: SharedArray.from_array(array) for name, array in inputs.items()}
+    out = SharedArray(out_shape, out_dtype)
+    try:
+        out.array[...] = fill
+        specs = {name: array.spec for name, array in shared.items()}
+        tasks = [(func, specs, out.spec, start, min(start + chunksize, n_rows), args)
+                 for start in range(0, n_rows, chunksize)]
+        map_tasks(_slice_task, tasks, processes)
+        return out.array.copy()
+    finally:
+        for array in shared.values():
+            array.unlink()
+        out.unlink()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact view of an OSMnx street network for filtering and plotting
+
+The graph is read once into NumPy arrays:
+ - All the edge vertices go into one shared (n, 2) coordinate buffer,
+   edge i uses the rows coords[offsets[i] : offsets[i+1]]
+ - Edge attributes such as 'highway' are stored as categorical codes, with
+   the edge indices of each category precomputed
+Edges are then drawn with one LineCollection per category, instead of
+converting the graph to GeoDataFrames and redrawing every edge per layer.
+"""
+
+import numpy as np
+
+
+class StreetNetwork:
+    def __init__(self, node_ids, node_xy, edge_uv, coords, offsets, columns):
+        self.node_ids = node_ids    # (n_nodes,) OSM node ids
+        self.node_xy = node_xy      # (n_nodes, 2) node coordinates
+        self.edge_uv = edge_uv      # (n_edges, 2) OSM node ids of the edge ends
+        self.coords = coords        # (n_vertices, 2) shared coordinate buffer
+        self.offsets = offsets      # (n_edges + 1,) edge slices in coords
+        # {attribute: (codes, categories, indices per category)}
+        self.columns = columns
+
+    @classmethod
+    def from_graph(cls, graph, attributes=('highway',)):
+        """Build the view from a NetworkX graph as returned by OSMnx"""
+        n_nodes = graph.number_of_nodes()
+        node_ids = np.empty(n_nodes, dtype=np.int64)
+        node_xy = np.empty((n_nodes, 2), dtype=np.float64)
+        node_ix = {}
+        for ix, (node, data) in enumerate(graph.nodes(data=True)):
+            node_ids[ix] = node
+            node_xy[ix] = data['x'], data['y']
+            node_ix[node] = ix
+
+        n_edges = graph.number_of_edges()
+        edge_uv = np.empty((n_edges, 2), dtype=np.int64)
+        lengths = np.empty(n_edges, dtype=np.int64)
+        values = {attribute: [] for attribute in attributes}
+        chunks = []
+        for ix, (u, v, data) in enumerate(graph.edges(data=True)):
+            edge_uv[ix] = u, v
+            if 'geometry' in data:
+                # Simplified edges keep their shape as a LineString
+                chunk = np.asarray(data['geometry'].coords, dtype=np.float64)
+            else:
+                # Otherwise the edge is a straight line between its nodes
+                chunk = node_xy[[node_ix[u], node_ix[v]]]
+            chunks.append(chunk)
+            lengths[ix] = len(chunk)
+            for attribute in attributes:
+                value = data.get(attribute)
+                # Merged edges can hold a list of values, keep the first one
+                if isinstance(value, list):
+                    value = value[0]
+                values[attribute].append(value)
+
+        offsets = np.zeros(n_edges + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        if chunks:
+            coords = np.concatenate(chunks)
+        else:
+            coords = np.empty((0, 2), dtype=np.float64)
+
+        columns = {attribute: categorize(values[attribute]) for attribute in attributes}
+        return cls(node_ids, node_xy, edge_uv, coords, offsets, columns)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def categories(self, attribute):
+        return self.columns[attribute][1]
+
+    def select(self, attribute, value):
+        """Indices of the edges with attribute == value"""
+        codes, categories, indices = self.columns[attribute]
+        if value not in categories:
+            return np.empty(0, dtype=np.int64)
+        return indices[categories.index(value)]
+
+    def segments(self, edges=None):
+        """List of (k, 2) views of the coordinate buffer, one per edge"""
+        if edges is None:
+            edges = range(len(self))
+        coords, offsets = self.coords, self.offsets
+        return [coords[offsets[ix] : offsets[ix + 1]] for ix in edges]
+
+    def bounds(self):
+        x_min, y_min = self.coords.min(axis=0)
+        x_max, y_max = self.coords.max(axis=0)
+        return x_min, y_min, x_max, y_max
+
+    def plot_edges(self, ax, attribute='highway', styles=None, default=None, zorder=None):
+        """
+        Draw the edges with one LineCollection per category of 'attribute'
+
+        styles: {category: LineCollection kwargs}, categories not in styles
+                and edges without the attribute are drawn with 'default', or
+                skipped if default is None
+        """
+        from matplotlib.collections import LineCollection
+
+        styles = {} if styles is None else styles
+        codes, categories, indices = self.columns[attribute]
+        collections = []
+        # Edges without the attribute (code -1) are not in any category
+        groups = list(zip(categories, indices)) + [(None, np.flatnonzero(codes == -1))]
+        for category, edges in groups:
+            style = default if category is None else styles.get(category, default)
+            if style is None or len(edges) == 0:
+                continue
+            collection = LineCollection(self.segments(edges), **style)
+            if zorder is not None and 'zorder' not in style:
+                collection.set_zorder(zorder)
+            ax.add_collection(collection)
+            collections.append(collection)
+        ax.autoscale_view()
+        return collections
+
+    def plot_nodes(self, ax, **kwargs):
+        return ax.scatter(self.node_xy[:, 0], self.node_xy[:, 1], **kwargs)
+
+
+def categorize(values):
+    """
+    Categorical codes for a list of values
+    Returns codes (int32, -1 for missing), categories (list) and
+    the array of element indices for each category
+    """
+    categories = sorted({value for value in values if value is not None}, key=str)
+    lookup = {category: ix for ix, category in enumerate(categories)}
+    codes = np.fromiter((lookup.get(value, -1) for value in values),
+                        dtype=np.int32, count=len(values))
+    # Group element indices by code with a single stable sort
+    order = np.argsort(codes, kind='stable')
+    splits = np.searchsorted(codes[order], np.arange(len(categories) + 1))
+    indices = [order[splits[ix] : splits[ix + 1]] for ix in range(len(categories))]
+    return codes, categories, indices
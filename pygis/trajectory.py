@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-user trajectory statistics for large post logs
+(columns lat, lon, timestamp, userid as in southafrica_posts.csv)
+
+The posts are partitioned in shards by a hash of the userid, so all the
+posts of one user are in the same shard. Each shard is processed in a
+worker process with vectorized NumPy over the posts sorted by user and time,
+and the per-user results of the shards are concatenated.
+For CSV files the shards are first written to disk reading the file in
+chunks, so the memory of each worker is bounded by the size of its shard.
+Workers are started with 'fork' (pygis.shared_memory.map_tasks), so scripts
+calling trajectory_stats() at top level are not imported again by the
+workers. Where 'fork' is not available the shards run in this process.
+
+Statistics per user:
+ n_posts             number of posts
+ total_distance      sum of the distances between consecutive posts (m)
+ max_speed           max speed between consecutive posts (m/s)
+ dwell_time          time between consecutive posts less than
+                     dwell_distance apart (s)
+ radius_of_gyration  RMS distance of the posts to their centroid (m)
+ first, last         time of the first and last post
+"""
+
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from pygis.distance import distance, haversine
+from pygis.post_index import parse_times
+from pygis.shared_memory import map_tasks
+
+# Record of the shard files
+POST_DTYPE = np.dtype([('lon', 'f8'), ('lat', 'f8'), ('time', 'i8'), ('userid', 'i8')])
+STATS_COLUMNS = ['n_posts', 'total_distance', 'max_speed', 'dwell_time',
+                 'radius_of_gyration', 'first', 'last']
+
+
+def shard_of(userid, n_shards):
+    """Shard of each userid, multiplicative hash so consecutive ids are spread"""
+    h = np.asarray(userid, dtype=np.int64).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    return ((h >> np.uint64(32)) % np.uint64(n_shards)).astype(np.int64)
+
+
+def user_stats(lon, lat, time, userid, method='geodesic', dwell_distance=100.0):
+    """Statistics per user for arrays of posts, DataFrame indexed by userid"""
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    time = np.asarray(time, dtype=np.int64)
+    userid = np.asarray(userid, dtype=np.int64)
+    if len(userid) == 0:
+        return pd.DataFrame(columns=STATS_COLUMNS, index=pd.Index([], name='userid'))
+
+    # Sort by user, then by time
+    order = np.lexsort((time, userid))
+    lon, lat, time, userid = lon[order], lat[order], time[order], userid[order]
+    n = len(userid)
+    starts = np.flatnonzero(np.r_[True, userid[1:] != userid[:-1]])
+    counts = np.diff(np.r_[starts, n])
+
+    # Step j goes from post j to post j+1, steps between users are masked
+    # The last post of each user has an empty step, so the steps can be
+    # reduced with the same starts as the posts
+    same = np.zeros(n, dtype=bool)
+    same[:-1] = userid[1:] == userid[:-1]
+    step = np.zeros(n)
+    dt = np.zeros(n, dtype=np.int64)
+    step[:-1] = distance(lon[:-1], lat[:-1], lon[1:], lat[1:], method=method)
+    dt[:-1] = time[1:] - time[:-1]
+    step[~same] = 0
+    dt[~same] = 0
+    moving = same & (dt > 0)
+    speed = np.full(n, -np.inf)
+    speed[moving] = step[moving] / dt[moving]
+    dwell = np.where(same & (step < dwell_distance), dt, 0)
+
+    total_distance = np.add.reduceat(step, starts)
+    max_speed = np.maximum.reduceat(speed, starts)
+    max_speed[np.isinf(max_speed)] = np.nan
+    dwell_time = np.add.reduceat(dwell, starts)
+
+    # Radius of gyration around the mean position of each user
+    lon_c = np.repeat(np.add.reduceat(lon, starts) / counts, counts)
+    lat_c = np.repeat(np.add.reduceat(lat, starts) / counts, counts)
+    d2 = haversine(lon, lat, lon_c, lat_c) ** 2
+    radius_of_gyration = np.sqrt(np.add.reduceat(d2, starts) / counts)
+
+    last = np.r_[starts[1:], n] - 1
+    return pd.DataFrame({'n_posts': counts,
+                         'total_distance': total_distance,
+                         'max_speed': max_speed,
+                         'dwell_time': dwell_time,
+                         'radius_of_gyration': radius_of_gyration,
+                         'first': time[starts].astype('datetime64[s]'),
+                         'last': time[last].astype('datetime64[s]')},
+                        index=pd.Index(userid[starts], name='userid'))
+
+
+def _shard_file_stats(args):
+    # Worker: statistics for one shard file
+    path, method, dwell_distance = args
+    posts = np.fromfile(path, dtype=POST_DTYPE)
+    return user_stats(posts['lon'], posts['lat'], posts['time'], posts['userid'],
+                      method=method, dwell_distance=dwell_distance)
+
+
+def _shard_stats(args):
+    # Worker: statistics for one shard of arrays
+    lon, lat, time, userid, method, dwell_distance = args
+    return user_stats(lon, lat, time, userid, method=method, dwell_distance=dwell_distance)
+
+
+def _merge(parts):
+    parts = [part for part in parts if len(part)]
+    if not parts:
+        return pd.DataFrame(columns=STATS_COLUMNS, index=pd.Index([], name='userid'))
+    return pd.concat(parts).sort_index()
+
+
+def trajectory_stats(lon, lat, time, userid, n_shards=None, processes=None,
+                     method='geodesic', dwell_distance=100.0):
+    """
+    Statistics per user for in-memory arrays, time in seconds since epoch
+    processes: number of worker processes, None for all the cores
+    n_shards: number of shards, by default one per process
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if n_shards is None:
+        n_shards = processes
+    userid = np.asarray(userid, dtype=np.int64)
+    shard = shard_of(userid, n_shards)
+    # Group the rows by shard with one sort
+    order = np.argsort(shard, kind='stable')
+    bounds = np.searchsorted(shard[order], np.arange(n_shards + 1))
+    arrays = [np.asarray(a)[order] for a in (lon, lat, time, userid)]
+    tasks = [tuple(a[bounds[i] : bounds[i + 1]] for a in arrays) + (method, dwell_distance)
+             for i in range(n_shards) if bounds[i] < bounds[i + 1]]
+    return _merge(map_tasks(_shard_stats, tasks, processes))
+
+
+def partition_csv(data_path, shard_dir, n_shards, chunksize=1000000,
+                  time_format='%Y-%m-%d %H:%M'):
+    """
+    Write the posts in 'data_path' to n_shards binary files in 'shard_dir',
+    reading the CSV in chunks of 'chunksize' rows. Returns the file paths
+    """
+    paths = [os.path.join(shard_dir, 'shard_{:04}.bin'.format(i)) for i in range(n_shards)]
+    for path in paths:
+        open(path, 'wb').close()
+    reader = pd.read_csv(data_path, usecols=['lat', 'lon', 'timestamp', 'userid'],
+                         dtype={'lat': np.float64, 'lon': np.float64, 'userid': np.int64},
+                         chunksize=chunksize)
+    for chunk in reader:
+        posts = np.empty(len(chunk), dtype=POST_DTYPE)
+        posts['lon'] = chunk['lon'].to_numpy()
+        posts['lat'] = chunk['lat'].to_numpy()
+        posts['time'] = parse_times(chunk['timestamp'], time_format)
+        posts['userid'] = chunk['userid'].to_numpy()
+        shard = shard_of(posts['userid'], n_shards)
+        order = np.argsort(shard, kind='stable')
+        bounds = np.searchsorted(shard[order], np.arange(n_shards + 1))
+        posts = posts[order]
+        for i, path in enumerate(paths):
+            if bounds[i] < bounds[i + 1]:
+                with open(path, 'ab') as fout:
+                    posts[bounds[i] : bounds[i + 1]].tofile(fout)
+    return paths
+
+
+def trajectory_stats_csv(data_path, n_shards=None, processes=None, chunksize=1000000,
+                         method='geodesic', dwell_distance=100.0, shard_dir=None):
+    """
+    Statistics per user for a CSV file of posts
+    n_shards: number of shards, the memory per worker is about
+              32 bytes * n_rows / n_shards. By default 4 per process
+    shard_dir: directory for the shard files, a temporary one by default
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    if n_shards is None:
+        n_shards = 4 * processes
+    with tempfile.TemporaryDirectory(dir=shard_dir) as tmp_dir:
+        paths = partition_csv(data_path, tmp_dir, n_shards, chunksize=chunksize)
+        tasks = [(path, method, dwell_distance) for path in paths if os.path.getsize(path)]
+        return _merge(map_tasks(_shard_file_stats, tasks, processes))
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Travel-time matrix of the Helsinki Region (YKR grid) as a memory-mapped
+uint16 array, for pair lookups and threshold queries without reading the
+shapefiles / text files again
+
+The Helsinki Region Travel Time Matrix comes as one file per destination
+cell (TravelTimes_to_5975375_RailwayStation.shp, travel_times_to_ 5975375.txt)
+with the columns from_id, to_id, pt_r_tt, walk_d, ...
+One value column is packed as matrix[to, from]: each destination is a
+contiguous row, so "all the cells within N minutes of B" reads one row.
+
+matrix = open_matrix(files, '../data/pt_r_tt.matrix', value='pt_r_tt')
+matrix.lookup(5785640, 5975375)              # minutes, NaN if no data
+matrix.to_cell(5975375)                      # Series from_id -> minutes
+matrix.within(5975375, 15)                   # from_id reaching B in <= 15 min
+
+Values are stored as round(value / scale), scale=1 for minutes, e.g.
+scale=10 for distances in meters (10 m resolution, up to 655 km).
+NoData (-1 in the source) is stored as NODATA.
+open_matrix() builds the matrix again when the source files change.
+"""
+
+import os
+import json
+import tempfile
+import numpy as np
+import pandas as pd
+
+NODATA = np.iinfo(np.uint16).max
+MAX_VALUE = NODATA - 1
+
+
+def _read(source, columns, sep):
+    # DataFrame with 'columns' from a text file, a shapefile or a DataFrame
+    if isinstance(source, pd.DataFrame):
+        return source[columns]
+    if str(source).lower().endswith(('.txt', '.csv')):
+        return pd.read_csv(source, sep=sep, usecols=columns)
+    import geopandas as gpd
+    # Only the attributes, the geometries of the cells are not needed
+    return pd.DataFrame(gpd.read_file(source, ignore_geometry=True)[columns])
+
+
+def _source_stats(sources):
+    # [path, size, mtime] of the files of 'sources', to detect stale matrices
+    stats = []
+    for source in sources:
+        if isinstance(source, pd.DataFrame):
+            continue
+        path = str(source)
+        if path.startswith('zip://'):
+            path = path[len('zip://'):].split('!')[0]
+        stat = os.stat(path)
+        stats.append([os.path.abspath(str(source)), stat.st_size, stat.st_mtime_ns])
+    return stats
+
+
+def build_matrix(sources, matrix_dir, value='pt_r_tt', scale=1, from_col='from_id',
+                 to_col='to_id', sep=';'):
+    """
+    Pack the column 'value' of 'sources' in a matrix saved in 'matrix_dir'
+    sources: paths (text files with 'sep', shapefiles, zip://) or DataFrames,
+             usually one per destination cell
+    scale:   units of the stored values, e.g. 1 minute or 10 meters
+    """
+    os.makedirs(matrix_dir, exist_ok=True)
+    # First pass, each source is read once: ids of the origin and destination
+    # cells, and the valid (from, to, value) rows kept in temporary files
+    from_ids = set()
+    to_ids = set()
+    n_values = 0
+    with tempfile.TemporaryDirectory(dir=matrix_dir) as tmp_dir:
+        parts = []
+        for ix, source in enumerate(sources):
+            df = _read(source, [from_col, to_col, value], sep)
+            from_ids.update(df[from_col].unique().tolist())
+            to_ids.update(df[to_col].unique().tolist())
+            values = df[value].to_numpy(dtype=np.float64)
+            valid = np.isfinite(values) & (values >= 0)
+            part = os.path.join(tmp_dir, 'part_{}.npz'.format(ix))
+            np.savez(part, from_id=df[from_col].to_numpy(dtype=np.int64)[valid],
+                     to_id=df[to_col].to_numpy(dtype=np.int64)[valid],
+                     stored=np.clip(np.round(values[valid] / scale), 0, MAX_VALUE).astype(np.uint16))
+            parts.append(part)
+        from_ids = np.array(sorted(from_ids), dtype=np.int64)
+        to_ids = np.array(sorted(to_ids), dtype=np.int64)
+
+        np.save(os.path.join(matrix_dir, 'from_ids.npy'), from_ids)
+        np.save(os.path.join(matrix_dir, 'to_ids.npy'), to_ids)
+        shape = (len(to_ids), len(from_ids))
+        matrix = np.lib.format.open_memmap(os.path.join(matrix_dir, 'matrix.npy'), mode='w+',
+                                           dtype=np.uint16, shape=shape)
+        matrix[:] = NODATA
+
+        # Second pass, values
+        for part in parts:
+            with np.load(part) as rows:
+                matrix[np.searchsorted(to_ids, rows['to_id']),
+                       np.searchsorted(from_ids, rows['from_id'])] = rows['stored']
+                n_values += len(rows['stored'])
+        matrix.flush()
+        del matrix
+
+    meta = {'value': value, 'scale': scale, 'shape': list(shape), 'n_values': n_values,
+            'sources': _source_stats(sources)}
+    with open(os.path.join(matrix_dir, 'meta.json'), 'w') as fout:
+        json.dump(meta, fout)
+    return TravelMatrix(matrix_dir)
+
+
+class _IdMap:
+    """Ids to positions, with a dense lookup table over the range of ids"""
+
+    def __init__(self, ids):
+        self.ids = ids
+        self.first = int(ids[0]) if len(ids) else 0
+        span = int(ids[-1]) - self.first + 1 if len(ids) else 0
+        self.table = np.full(span, -1, dtype=np.int32)
+        self.table[ids - self.first] = np.arange(len(ids), dtype=np.int32)
+
+    def __call__(self, ids):
+        """Positions of 'ids', -1 for unknown ids"""
+        ids = np.asarray(ids, dtype=np.int64)
+        offset = ids - self.first
+        inside = (offset >= 0) & (offset < len(self.table))
+        return np.where(inside, self.table[np.where(inside, offset, 0)], -1)
+
+    def position(self, one_id):
+        pos = int(self(one_id))
+        if pos < 0:
+            raise ValueError('Unknown cell id: ' + str(one_id))
+        return pos
+
+
+class TravelMatrix:
+    def __init__(self, matrix_dir):
+        self.matrix_dir = matrix_dir
+        with open(os.path.join(matrix_dir, 'meta.json')) as fin:
+            self.meta = json.load(fin)
+        self.scale = self.meta['scale']
+        self.from_ids = np.load(os.path.join(matrix_dir, 'from_ids.npy'))
+        self.to_ids = np.load(os.path.join(matrix_dir, 'to_ids.npy'))
+        self.matrix = np.load(os.path.join(matrix_dir, 'matrix.npy'), mmap_mode='r')
+        self._from = _IdMap(self.from_ids)
+        self._to = _IdMap(self.to_ids)
+
+    @property
+    def shape(self):
+        """(number of destinations, number of origins)"""
+        return self.matrix.shape
+
+    def _values(self, stored):
+        # Stored uint16 to values in the units of the source, NaN for NoData
+        return np.where(stored == NODATA, np.nan, stored.astype(np.float64) * self.scale)
+
+    def lookup(self, from_id, to_id):
+        """Value from each from_id to each to_id (scalars or arrays), NaN if unknown"""
+        rows = self._to(to_id)
+        cols = self._from(from_id)
+        rows, cols = np.broadcast_arrays(rows, cols)
+        known = (rows >= 0) & (cols >= 0)
+        stored = np.full(rows.shape, NODATA, dtype=np.uint16)
+        stored[known] = self.matrix[rows[known], cols[known]]
+        values = self._values(stored)
+        return values if values.ndim else float(values)
+
+    def to_cell(self, to_id):
+        """Series from_id -> value to the cell 'to_id'"""
+        stored = np.asarray(self.matrix[self._to.position(to_id)])
+        return pd.Series(self._values(stored), index=pd.Index(self.from_ids, name='from_id'),
+                         name=self.meta['value'])
+
+    def from_cell(self, from_id):
+        """Series to_id -> value from the cell 'from_id' (reads one value per row)"""
+        stored = np.asarray(self.matrix[:, self._from.position(from_id)])
+        return pd.Series(self._values(stored), index=pd.Index(self.to_ids, name='to_id'),
+                         name=self.meta['value'])
+
+    def within(self, to_id, max_value):
+        """from_id of the cells with a value to 'to_id' <= max_value"""
+        row = self.matrix[self._to.position(to_id)]
+        limit = min(np.floor(max_value / self.scale + 1e-9), MAX_VALUE)
+        if limit < 0:
+            return self.from_ids[:0]
+        return self.from_ids[np.flatnonzero(row <= limit)]
+
+    def reachable(self, from_id, max_value):
+        """to_id of the cells with a value from 'from_id' <= max_value"""
+        column = self.matrix[:, self._from.position(from_id)]
+        limit = min(np.floor(max_value / self.scale + 1e-9), MAX_VALUE)
+        if limit < 0:
+            return self.to_ids[:0]
+        return self.to_ids[np.flatnonzero(column <= limit)]
+
+
+def open_matrix(sources, matrix_dir, rebuild=False, **kwargs):
+    """
+    Open the matrix in 'matrix_dir', building it from 'sources' if missing or
+    if the files of 'sources' changed (size, modification time)
+    """
+    if not rebuild and os.path.exists(os.path.join(matrix_dir, 'meta.json')):
+        matrix = TravelMatrix(matrix_dir)
+        if matrix.meta.get('sources') == _source_stats(sources):
+            return matrix
+    return build_matrix(sources, matrix_dir, **kwargs)
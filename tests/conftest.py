@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Behavior tests of the shared modules, run from the root of the repository
+
+$ python -m pytest tests
+"""
+
+import os
+import sys
+
+# Shared modules in ../pygis
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data')
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Artifacts are reused when their inputs are the same, computed again when they change"""
+
+import os
+import importlib
+from pygis.artifacts import ArtifactStore, file_digest
+
+
+class Counter:
+    """Stage function that counts its calls"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, *deps, **params):
+        self.calls += 1
+        return {'deps': deps, 'params': params}
+
+
+def test_hit_in_memory():
+    func = Counter()
+    store = ArtifactStore(None, verbose=False)
+    first = store.stage('a', func, {'x': 1})
+    assert not first.cached
+    assert first.load() == {'deps': (), 'params': {'x': 1}}
+    assert first.cached
+    # Same stage again, same key
+    again = store.stage('a', func, {'x': 1})
+    assert again.key == first.key
+    assert again.load() == first.load()
+    assert func.calls == 1
+
+
+def test_hit_on_disk(tmp_path):
+    func = Counter()
+    ArtifactStore(str(tmp_path), verbose=False).stage('a', func, {'x': 1}).load()
+    # New store (a new run) on the same directory
+    artifact = ArtifactStore(str(tmp_path), verbose=False).stage('a', func, {'x': 1})
+    assert artifact.cached
+    assert artifact.load() == {'deps': (), 'params': {'x': 1}}
+    assert func.calls == 1
+    assert os.path.exists(artifact.path[:-4] + '.json')
+
+
+def test_miss_on_param_change():
+    func = Counter()
+    store = ArtifactStore(None, verbose=False)
+    first = store.stage('a', func, {'x': 1})
+    other = store.stage('a', func, {'x': 2})
+    assert other.key != first.key
+    assert other.load()['params'] == {'x': 2}
+    assert first.load()['params'] == {'x': 1}
+    assert func.calls == 2
+
+
+def test_unhashed_and_tags():
+    func = Counter()
+    store = ArtifactStore(None, verbose=False)
+    first = store.stage('a', func, {'x': 1}, unhashed={'processes': 2})
+    # Unhashed arguments are passed, but do not change the key
+    assert first.load()['params'] == {'x': 1, 'processes': 2}
+    artifact = store.stage('a', func, {'x': 1}, unhashed={'processes': 8})
+    assert artifact.key == first.key
+    assert artifact.load()['params'] == {'x': 1, 'processes': 2}
+    assert func.calls == 1
+    # Tags change the key, but are not passed
+    tagged = store.stage('a', func, {'x': 1}, tags={'client': 'stand_in'})
+    assert tagged.key != first.key
+    assert tagged.load()['params'] == {'x': 1}
+
+
+def test_file_content_invalidates(tmp_path):
+    path = str(tmp_path / 'input.txt')
+    with open(path, 'w') as fout:
+        fout.write('a,b\n1,2\n')
+    func = Counter()
+    store = ArtifactStore(str(tmp_path / 'cache'), verbose=False)
+    key = store.stage('a', func, {'path': path}, files=['path']).key
+    # Same content written again, same key
+    with open(path, 'w') as fout:
+        fout.write('a,b\n1,2\n')
+    assert store.stage('a', func, {'path': path}, files=['path']).key == key
+    with open(path, 'w') as fout:
+        fout.write('a,b\n1,3\n')
+    os.utime(path, ns=(1, 1))
+    artifact = store.stage('a', func, {'path': path}, files=['path'])
+    assert artifact.key != key
+    assert not artifact.cached
+    assert file_digest(path) != file_digest(__file__)
+
+
+def test_deps(tmp_path):
+    func = Counter()
+    store = ArtifactStore(str(tmp_path), verbose=False)
+    upstream = store.stage('up', func, {'x': 1})
+    downstream = store.stage('down', func, {'y': 1}, deps=[upstream])
+    assert downstream.load()['deps'] == ({'deps': (), 'params': {'x': 1}},)
+    assert func.calls == 2
+    # A change upstream changes the key of the stages that depend on it
+    changed = store.stage('down', func, {'y': 1}, deps=[store.stage('up', func, {'x': 2})])
+    assert changed.key != downstream.key
+    # Cached stages do not load the stages before them
+    store = ArtifactStore(str(tmp_path), verbose=False)
+    upstream = store.stage('up', func, {'x': 1})
+    store.stage('down', func, {'y': 1}, deps=[upstream]).load()
+    assert upstream.key not in store.memory
+    assert func.calls == 2
+
+
+def _write_module(directory, name, body):
+    with open(os.path.join(directory, name + '.py'), 'w') as fout:
+        fout.write(body)
+    importlib.invalidate_caches()
+    module = importlib.import_module(name)
+    return importlib.reload(module)
+
+
+def test_code(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr('sys.dont_write_bytecode', True)
+    helper = _write_module(str(tmp_path), 'artifacts_helper', 'def scale(x):\n    return 2 * x\n')
+    _write_module(str(tmp_path), 'artifacts_plots', 'def plot(x):\n    return x\n')
+    stages = _write_module(str(tmp_path), 'artifacts_stages',
+                           'import artifacts_helper\n\n\n'
+                           'def grid(x):\n    return artifacts_helper.scale(x)\n')
+    store = ArtifactStore(None, verbose=False)
+    key = store.stage('grid', stages.grid, {'x': 1}, code=[helper]).key
+    assert store.stage('grid', stages.grid, {'x': 1}, code=[helper]).load() == 2
+
+    # Module not listed in code=, same key
+    _write_module(str(tmp_path), 'artifacts_plots', 'def plot(x):\n    return -x  # edited\n')
+    assert store.stage('grid', stages.grid, {'x': 1}, code=[helper]).key == key
+
+    # Helper listed in code=
+    helper = _write_module(str(tmp_path), 'artifacts_helper', 'def scale(x):\n    return 3 * x\n')
+    artifact = store.stage('grid', stages.grid, {'x': 1}, code=[helper])
+    assert artifact.key != key
+    assert artifact.load() == 3
+
+    # Stage function
+    stages = _write_module(str(tmp_path), 'artifacts_stages',
+                           'import artifacts_helper\n\n\n'
+                           'def grid(x):\n    return artifacts_helper.scale(x) + 1\n')
+    assert store.stage('grid', stages.grid, {'x': 1}, code=[helper]).key != artifact.key
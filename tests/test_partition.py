@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The partitioned operations equal the serial GeoPandas ones"""
+
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+from shapely.geometry import box, Point
+from pygis.partition import (partition, parallel_apply, parallel_map, parallel_to_crs,
+                             parallel_sjoin, parallel_overlay)
+
+KW = {'n_parts': 5, 'processes': 2}
+
+
+def _cells(n, seed, index=None):
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, 10000, n)
+    y = rng.uniform(0, 10000, n)
+    size = rng.uniform(50, 400, n)
+    return gpd.GeoDataFrame({'value': np.arange(n), 'size': size},
+                            geometry=[box(a, b, a + s, b + s) for a, b, s in zip(x, y, size)],
+                            index=index, crs=3067)
+
+
+@pytest.fixture(params=['unique', 'duplicated'])
+def cells(request):
+    n = 800
+    # Labels in a shuffled order, or each label twice
+    rng = np.random.default_rng(1)
+    index = rng.permutation(n) + 100 if request.param == 'unique' else np.arange(n) // 2
+    return _cells(n, 0, index=pd.Index(index, name='cell'))
+
+
+@pytest.fixture
+def lakes():
+    lakes = _cells(60, 2)
+    lakes['geometry'] = lakes.geometry.centroid.buffer(lakes['size'] * 2)
+    return lakes.rename(columns={'value': 'lake'}).drop(columns='size')
+
+
+@pytest.mark.parametrize('method', ['hilbert', 'grid'])
+def test_partition_covers_rows_once(cells, method):
+    parts = partition(cells.geometry, 7, method=method)
+    rows = np.concatenate(parts)
+    assert np.array_equal(np.sort(rows), np.arange(len(cells)))
+    assert all(np.all(np.diff(part) > 0) for part in parts)
+
+
+def test_apply_equals_serial(cells):
+    point = Point(5000, 5000)
+    result = parallel_apply(cells.geometry, lambda cell: cell.distance(point), **KW)
+    pd.testing.assert_series_equal(result.astype(np.float64),
+                                   cells.geometry.apply(lambda cell: cell.distance(point)),
+                                   check_names=False)
+
+
+def test_apply_empty(cells):
+    assert len(parallel_apply(cells.geometry.iloc[:0], lambda cell: cell.area, **KW)) == 0
+
+
+def test_map_equals_serial(cells):
+    points = gpd.GeoSeries([Point(1000, 2000), Point(8000, 500), Point(5000, 9000)])
+
+    def distances(part):
+        return pd.DataFrame({ix: part.distance(point) for ix, point in points.items()},
+                            index=part.index)
+
+    result = parallel_map(cells.geometry, distances, **KW)
+    expected = pd.DataFrame({ix: cells.distance(point) for ix, point in points.items()})
+    pd.testing.assert_frame_equal(result, expected)
+
+
+def test_map_checks_the_number_of_rows(cells):
+    with pytest.raises(ValueError):
+        parallel_map(cells.geometry, lambda part: part.iloc[:1], **KW)
+
+
+def test_to_crs_equals_serial(cells):
+    result = parallel_to_crs(cells, epsg=4326, **KW)
+    expected = cells.to_crs(epsg=4326)
+    assert result.crs == expected.crs
+    assert result.index.equals(expected.index)
+    pd.testing.assert_frame_equal(pd.DataFrame(result.drop(columns='geometry')),
+                                  pd.DataFrame(expected.drop(columns='geometry')))
+    assert result.geometry.geom_equals_exact(expected.geometry, 1e-9).all()
+
+
+def _pairs(joined):
+    # (left label, left value, right label) of each row of a join, sorted
+    pairs = zip(joined.index, joined['value'], joined['index_right'].fillna(-1))
+    return sorted(pairs)
+
+
+@pytest.mark.parametrize('how, predicate', [('inner', 'intersects'), ('inner', 'within'),
+                                            ('left', 'intersects')])
+def test_sjoin_equals_serial(cells, lakes, how, predicate):
+    result = parallel_sjoin(cells, lakes, how=how, predicate=predicate, **KW)
+    expected = gpd.sjoin(cells, lakes, how=how, predicate=predicate)
+    assert len(result) == len(expected) > 0
+    assert _pairs(result) == _pairs(expected)
+    # Rows in the order of 'left'
+    assert np.all(np.diff(result['value'].to_numpy()) >= 0)
+
+
+@pytest.mark.parametrize('kwargs', [{'how': 'right'}, {'predicate': 'dwithin', 'distance': 5}])
+def test_sjoin_unsupported(cells, lakes, kwargs):
+    with pytest.raises(ValueError):
+        parallel_sjoin(cells, lakes, **kwargs)
+
+
+def _areas(overlay):
+    # Area of the result by (cell, lake), independent of the row order
+    keys = ['value', 'lake'] if 'lake' in overlay else ['value']
+    return overlay.assign(area=overlay.area).groupby(keys)['area'].sum().sort_index()
+
+
+@pytest.mark.parametrize('how', ['intersection', 'difference', 'identity'])
+def test_overlay_equals_serial(cells, lakes, how):
+    result = parallel_overlay(cells, lakes, how=how, **KW)
+    expected = gpd.overlay(cells, lakes, how=how)
+    assert result.index.equals(pd.RangeIndex(len(result)))
+    pd.testing.assert_series_equal(_areas(result), _areas(expected))
+
+
+@pytest.mark.parametrize('how', ['intersection', 'difference'])
+def test_overlay_empty_right(cells, lakes, how):
+    # No lake near the cells, every part gets an empty right side
+    far = lakes.set_geometry(lakes.translate(1e6, 1e6))
+    result = parallel_overlay(cells, far, how=how, **KW)
+    expected = gpd.overlay(cells, far, how=how)
+    assert len(result) == len(expected)
+    if how == 'difference':
+        pd.testing.assert_series_equal(_areas(result), _areas(expected))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The point layer round-trips its coordinates and filters them as the floats would"""
+
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+from conftest import DATA_DIR
+from pygis.points import PointLayer, read_points_csv
+
+POSTS = os.path.join(DATA_DIR, 'southafrica_posts.csv')
+
+
+@pytest.fixture(scope='module')
+def posts():
+    return pd.read_csv(POSTS)
+
+
+@pytest.mark.parametrize('resolution', [1e-6, 1e-4])
+def test_quantize_round_trip(posts, resolution):
+    layer = PointLayer(posts['lon'], posts['lat'], crs=4326, resolution=resolution)
+    assert layer._x.dtype == np.int32
+    assert np.abs(layer.x - posts['lon'].to_numpy()).max() <= resolution / 2 * (1 + 1e-6)
+    assert np.abs(layer.y - posts['lat'].to_numpy()).max() <= resolution / 2 * (1 + 1e-6)
+    assert layer.nbytes == 8 * len(posts)
+
+
+def test_float_layer_keeps_coordinates(posts):
+    layer = PointLayer(posts['lon'], posts['lat'], crs=4326)
+    np.testing.assert_array_equal(layer.x, posts['lon'].to_numpy())
+    np.testing.assert_array_equal(layer.y, posts['lat'].to_numpy())
+
+
+def test_overflow():
+    with pytest.raises(ValueError):
+        PointLayer([0.0, 10000.0], [0.0, 0.0], resolution=1e-6)
+    with pytest.raises(ValueError):
+        PointLayer([0.0, np.nan], [0.0, 0.0], resolution=1.0, origin=(0, 0))
+
+
+def test_bbox_mask_edges():
+    # Points on the edges of the bbox, and one step outside each edge
+    x = np.array([10.0, 20.0, 15.0, 15.0, 9.75, 20.25, 15.0, 15.0])
+    y = np.array([35.0, 35.0, 30.0, 40.0, 35.0, 35.0, 29.75, 40.25])
+    inside = np.array([True, True, True, True, False, False, False, False])
+    for resolution in (None, 0.25):
+        layer = PointLayer(x, y, resolution=resolution, origin=(12.5, 33.25))
+        np.testing.assert_array_equal(layer.bbox_mask(10, 30, 20, 40), inside)
+        # Bbox edges between two quantization steps
+        np.testing.assert_array_equal(layer.bbox_mask(9.8, 29.8, 20.2, 40.2), inside)
+
+
+@pytest.mark.parametrize('resolution', [None, 1e-6])
+def test_bbox_mask_equals_float_filter(posts, resolution):
+    layer = PointLayer(posts['lon'], posts['lat'], crs=4326, resolution=resolution)
+    rng = np.random.default_rng(0)
+    # Bboxes with edges on the coordinates of some points
+    for ix in rng.choice(len(posts), 20, replace=False):
+        x_min, y_min = layer.x[ix], layer.y[ix]
+        x_max, y_max = x_min + rng.uniform(0, 2), y_min + rng.uniform(0, 2)
+        expected = ((layer.x >= x_min) & (layer.x <= x_max) &
+                    (layer.y >= y_min) & (layer.y <= y_max))
+        mask = layer.bbox_mask(x_min, y_min, x_max, y_max)
+        np.testing.assert_array_equal(mask, expected)
+        assert mask[ix]
+
+
+@pytest.mark.parametrize('resolution', [None, 1e-6])
+def test_read_points_csv_equals_in_memory(posts, resolution):
+    layer = read_points_csv(POSTS, x='lon', y='lat', crs=4326, resolution=resolution,
+                            chunksize=20000)
+    expected = PointLayer(posts['lon'], posts['lat'], crs=4326, resolution=resolution,
+                          data=posts.drop(columns=['lon', 'lat']))
+    assert layer.origin == expected.origin
+    assert layer.crs == expected.crs
+    assert layer._x.dtype == expected._x.dtype
+    np.testing.assert_array_equal(layer._x, expected._x)
+    np.testing.assert_array_equal(layer._y, expected._y)
+    pd.testing.assert_frame_equal(layer.data, expected.data)
+
+
+def test_read_points_csv_columns(posts):
+    layer = read_points_csv(POSTS, x='lon', y='lat', crs=4326, columns=['userid'])
+    assert list(layer.data.columns) == ['userid']
+    assert read_points_csv(POSTS, x='lon', y='lat', columns=[]).data is None
+
+
+def test_take_and_geodataframe(posts):
+    layer = read_points_csv(POSTS, x='lon', y='lat', crs=4326, resolution=1e-6)
+    part = layer.within_bbox(31.4, -25.1, 31.7, -24.8)
+    rows = np.flatnonzero(layer.bbox_mask(31.4, -25.1, 31.7, -24.8))
+    assert len(part) == len(rows) > 0
+    gdf = part.to_geodataframe()
+    np.testing.assert_allclose(gdf.geometry.x, layer.x[rows])
+    pd.testing.assert_frame_equal(pd.DataFrame(gdf.drop(columns='geometry')),
+                                  layer.data.iloc[rows].reset_index(drop=True))
+
+
+def test_to_crs_equals_geopandas(posts):
+    layer = PointLayer(posts['lon'], posts['lat'], crs=4326).take(np.arange(0, len(posts), 50))
+    utm = layer.to_crs(32735)
+    expected = layer.to_geoseries().to_crs(32735)
+    np.testing.assert_allclose(utm.x, expected.x)
+    np.testing.assert_allclose(utm.y, expected.y)
+    dist = utm.distance(utm.x[0], utm.y[0])
+    np.testing.assert_allclose(dist, expected.distance(expected.iloc[0]).to_numpy())
+    assert isinstance(utm.to_geodataframe(), gpd.GeoDataFrame)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The surface sums equal the spatial joins of the population grid"""
+
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+from shapely.geometry import box
+from conftest import DATA_DIR
+from pygis.population import open_surface, BUFFER_RESOLUTION
+
+SOURCE = 'zip://' + os.path.join(DATA_DIR, 'Vaestotietoruudukko_2015.zip')
+
+
+@pytest.fixture(scope='module')
+def pop():
+    return gpd.read_file(SOURCE).to_crs(3035)
+
+
+@pytest.fixture(scope='module')
+def surface(pop, tmp_path_factory):
+    # Small tiles, so the queries span several tiles
+    return open_surface(pop, str(tmp_path_factory.mktemp('surface')), crs=3035,
+                        column='ASUKKAITA', tile_size=5000.0)
+
+
+@pytest.fixture(scope='module')
+def points(pop):
+    rng = np.random.default_rng(0)
+    x_min, y_min, x_max, y_max = pop.total_bounds
+    x = rng.uniform(x_min, x_max, 20)
+    y = rng.uniform(y_min, y_max, 20)
+    return gpd.GeoSeries(gpd.points_from_xy(x, y), crs=pop.crs)
+
+
+def _sjoin_sums(left, right, predicate):
+    # Population of 'left' joined to each geometry of 'right', 0 without matches
+    right = gpd.GeoDataFrame(geometry=right.reset_index(drop=True))
+    joined = gpd.sjoin(left[['ASUKKAITA', 'geometry']], right, predicate=predicate)
+    sums = joined.groupby('index_right')['ASUKKAITA'].sum()
+    return sums.reindex(range(len(right)), fill_value=0).to_numpy(dtype=np.float64)
+
+
+@pytest.mark.parametrize('radius', [1000.0, 2500.0, 5000.0])
+def test_within_radius_equals_sjoin(pop, surface, points, radius):
+    buffers = points.buffer(radius, BUFFER_RESOLUTION)
+    expected = _sjoin_sums(pop, buffers, 'within')
+    totals = surface.sum_within_radius(points.x, points.y, radius, cells='within')
+    np.testing.assert_allclose(totals, expected)
+    assert expected.sum() > 0
+
+
+def test_centroid_radius_equals_distance_filter(pop, surface, points):
+    centroids = pop.geometry.centroid
+    expected = [pop['ASUKKAITA'][centroids.distance(p) <= 2500].sum() for p in points]
+    totals = surface.sum_within_radius(points.x, points.y, 2500, cells='centroid')
+    np.testing.assert_allclose(totals, expected)
+
+
+def test_within_polygons_equals_sjoin(pop, surface, points):
+    polygons = gpd.GeoSeries([box(p.x - 3000, p.y - 2000, p.x + 3000, p.y + 2000)
+                              for p in points], crs=pop.crs)
+    # Polygons in another CRS are reprojected to the one of the surface
+    polygons = pd.concat([polygons, points.buffer(4000)]).to_crs(3067)
+    centroids = pop.set_geometry(pop.geometry.centroid).to_crs(3067)
+    expected = _sjoin_sums(centroids, polygons, 'within')
+    np.testing.assert_allclose(surface.sum_within_polygons(polygons), expected)
+
+
+def test_no_points(surface):
+    assert len(surface.sum_within_radius([], [], 1000)) == 0
+
+
+def test_within_needs_quadrilaterals(pop, tmp_path):
+    circles = pop.iloc[:50].copy()
+    circles['geometry'] = circles.geometry.centroid.buffer(100)
+    surface = open_surface(circles, str(tmp_path), crs=3035, column='ASUKKAITA')
+    with pytest.raises(ValueError):
+        surface.sum_within_radius([0.0], [0.0], 1000, cells='within')
+
+
+def test_rebuild_after_source_changes(pop, tmp_path):
+    path = str(tmp_path / 'pop.gpkg')
+    pop.iloc[:100].to_file(path, driver='GPKG')
+    surface_dir = str(tmp_path / 'surface')
+    surface = open_surface(path, surface_dir, crs=3035, column='ASUKKAITA')
+    assert len(surface) == 100
+    # Same source, the surface is reused
+    written = os.stat(os.path.join(surface_dir, 'tiles.json')).st_mtime_ns
+    open_surface(path, surface_dir, crs=3035, column='ASUKKAITA')
+    assert os.stat(os.path.join(surface_dir, 'tiles.json')).st_mtime_ns == written
+
+    pop.iloc[:150].to_file(path, driver='GPKG')
+    surface = open_surface(path, surface_dir, crs=3035, column='ASUKKAITA')
+    assert len(surface) == 150
+    total = sum(tile['population'] for tile in surface.tiles)
+    assert total == pytest.approx(pop['ASUKKAITA'].iloc[:150].sum())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The index queries equal a brute-force filter of the posts"""
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import DATA_DIR
+from pygis.post_index import open_index, parse_times, hilbert_key
+
+
+@pytest.fixture(scope='module')
+def posts_path(tmp_path_factory):
+    # Copy of the posts, so the index is written in the temporary directory
+    path = tmp_path_factory.mktemp('posts') / 'southafrica_posts.csv'
+    shutil.copy(os.path.join(DATA_DIR, 'southafrica_posts.csv'), path)
+    return str(path)
+
+
+@pytest.fixture(scope='module')
+def posts(posts_path):
+    posts = pd.read_csv(posts_path)
+    posts['time'] = parse_times(posts['timestamp'])
+    return posts
+
+
+def _brute_force(posts, bbox=None, start=None, end=None):
+    keep = np.ones(len(posts), dtype=bool)
+    if bbox is not None:
+        keep &= ((posts['lon'] >= bbox[0]) & (posts['lat'] >= bbox[1]) &
+                 (posts['lon'] <= bbox[2]) & (posts['lat'] <= bbox[3])).to_numpy()
+    if start is not None:
+        keep &= (posts['time'] >= pd.Timestamp(start).value // 10**9).to_numpy()
+    if end is not None:
+        keep &= (posts['time'] < pd.Timestamp(end).value // 10**9).to_numpy()
+    return np.flatnonzero(keep)
+
+
+@pytest.mark.parametrize('bbox, start, end', [
+    ((31.4, -25.1, 31.7, -24.8), '2015-07-01', '2015-08-01'),
+    ((31.4, -25.1, 31.7, -24.8), None, None),
+    ((31.0, -26.0, 32.0, -24.0), '2015-02-25', '2015-03-05'),
+    (None, '2015-12-24', '2015-12-26'),
+    ((31.58, -25.0, 31.6, -24.98), None, '2015-06-01'),
+    ((10.0, 10.0, 11.0, 11.0), None, None),
+])
+def test_query_equals_brute_force(posts_path, posts, bbox, start, end):
+    index = open_index(posts_path)
+    result = index.query(bbox=bbox, start=start, end=end)
+    expected = _brute_force(posts, bbox, start, end)
+    np.testing.assert_array_equal(result.index.to_numpy(), expected)
+    np.testing.assert_array_equal(result['userid'].to_numpy(),
+                                  posts['userid'].to_numpy()[expected])
+
+
+def test_query_few_ranges(posts_path, posts):
+    # Coarse key ranges read more candidate rows, the result is the same
+    bbox = (31.4, -25.1, 31.7, -24.8)
+    result = open_index(posts_path).query(bbox=bbox, max_ranges=4)
+    np.testing.assert_array_equal(result.index.to_numpy(), _brute_force(posts, bbox))
+
+
+def test_query_users(posts_path, posts):
+    users = posts['userid'].unique()[:5]
+    result = open_index(posts_path).query(users=users, start='2015-06-01')
+    expected = np.flatnonzero(posts['userid'].isin(users).to_numpy() &
+                              (posts['time'] >= pd.Timestamp('2015-06-01').value // 10**9))
+    np.testing.assert_array_equal(result.index.to_numpy(), expected)
+
+
+def test_invalid_dates_roll_over():
+    times = parse_times(pd.Series(['2015-02-30 10:15', '2015-03-02 10:15', '2015-04-31 00:00',
+                                   '2015-05-01 00:00']))
+    assert times[0] == times[1]
+    assert times[2] == times[3]
+
+
+def test_invalid_dates_are_indexed(tmp_path):
+    path = tmp_path / 'posts.csv'
+    pd.DataFrame({'lat': [-25.0, -25.1], 'lon': [31.5, 31.6],
+                  'timestamp': ['2015-02-30 10:15', '2015-02-27 08:00'],
+                  'userid': [1, 2]}).to_csv(path, index=False)
+    result = open_index(str(path)).query(start='2015-03-01', end='2015-03-03')
+    assert result['userid'].tolist() == [1]
+    assert str(result['timestamp'].iloc[0]) == '2015-03-02 10:15:00'
+
+
+def test_hilbert_key_is_a_permutation():
+    order = 4
+    ix, iy = np.meshgrid(np.arange(1 << order), np.arange(1 << order), indexing='ij')
+    keys = hilbert_key(ix.ravel(), iy.ravel(), order)
+    np.testing.assert_array_equal(np.sort(keys), np.arange(1 << (2 * order)))
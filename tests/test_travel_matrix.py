@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""The matrix queries equal a pandas filter of the source files"""
+
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import pytest
+from conftest import DATA_DIR
+from pygis.travel_matrix import open_matrix
+
+FROM_IDS = np.arange(300) + 5785640
+TO_IDS = [5785700, 5785760, 5785900, 5785901]
+
+
+def _frame(to_id, seed):
+    # Travel times to 'to_id', NoData (-1) for some origins, others missing
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'from_id': FROM_IDS, 'to_id': to_id,
+                       'pt_r_tt': rng.integers(1, 60, len(FROM_IDS))})
+    df.loc[rng.random(len(df)) < 0.05, 'pt_r_tt'] = -1
+    df = df[rng.random(len(df)) > 0.1]
+    return gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df['from_id'] % 100 * 250.0,
+                                                            df['from_id'] // 100 * 250.0),
+                            crs=3067)
+
+
+def _write(frames, directory):
+    paths = []
+    for frame in frames:
+        path = os.path.join(directory, 'TravelTimes_to_{}.shp'.format(frame['to_id'].iloc[0]))
+        frame.to_file(path)
+        paths.append(path)
+    return paths
+
+
+@pytest.fixture(scope='module')
+def sources(tmp_path_factory):
+    frames = [_frame(to_id, seed) for seed, to_id in enumerate(TO_IDS)]
+    paths = _write(frames, str(tmp_path_factory.mktemp('shapefiles')))
+    table = pd.concat([pd.DataFrame(gpd.read_file(path, ignore_geometry=True))
+                       for path in paths], ignore_index=True)
+    return paths, table
+
+
+@pytest.fixture(scope='module')
+def matrix(sources, tmp_path_factory):
+    return open_matrix(sources[0], str(tmp_path_factory.mktemp('matrix')))
+
+
+def test_lookup_equals_source(sources, matrix):
+    table = sources[1]
+    values = matrix.lookup(table['from_id'].to_numpy(), table['to_id'].to_numpy())
+    expected = table['pt_r_tt'].where(table['pt_r_tt'] >= 0).to_numpy(dtype=np.float64)
+    np.testing.assert_array_equal(values, expected)
+    row = table[table['pt_r_tt'] >= 0].iloc[0]
+    assert matrix.lookup(row['from_id'], row['to_id']) == pytest.approx(row['pt_r_tt'])
+
+
+def test_lookup_missing_pairs(sources, matrix):
+    table = sources[1]
+    # Origins without a row for a destination, and unknown ids
+    missing = set(FROM_IDS) - set(table.loc[table['to_id'] == TO_IDS[0], 'from_id'])
+    assert missing
+    assert np.isnan(matrix.lookup(sorted(missing), TO_IDS[0])).all()
+    assert np.isnan(matrix.lookup(1, TO_IDS[0]))
+    assert np.isnan(matrix.lookup(FROM_IDS[0], 1))
+
+
+@pytest.mark.parametrize('to_id', TO_IDS)
+def test_to_cell_equals_source(sources, matrix, to_id):
+    table = sources[1]
+    rows = table[(table['to_id'] == to_id) & (table['pt_r_tt'] >= 0)]
+    expected = rows.set_index('from_id')['pt_r_tt'].astype(np.float64)
+    result = matrix.to_cell(to_id)
+    pd.testing.assert_series_equal(result.dropna(), expected.sort_index(), check_names=False)
+
+
+@pytest.mark.parametrize('to_id', TO_IDS)
+@pytest.mark.parametrize('max_value', [-1, 0, 15, 30.5, 100])
+def test_within_equals_filter(sources, matrix, to_id, max_value):
+    table = sources[1]
+    rows = table[(table['to_id'] == to_id) & (table['pt_r_tt'] >= 0) &
+                 (table['pt_r_tt'] <= max_value)]
+    np.testing.assert_array_equal(matrix.within(to_id, max_value), np.sort(rows['from_id']))
+
+
+@pytest.mark.parametrize('max_value', [10, 45])
+def test_reachable_equals_filter(sources, matrix, max_value):
+    table = sources[1]
+    from_id = FROM_IDS[7]
+    rows = table[(table['from_id'] == from_id) & (table['pt_r_tt'] >= 0) &
+                 (table['pt_r_tt'] <= max_value)]
+    np.testing.assert_array_equal(matrix.reachable(from_id, max_value), np.sort(rows['to_id']))
+
+
+def test_unknown_cell(matrix):
+    with pytest.raises(ValueError):
+        matrix.within(1, 15)
+
+
+def test_text_source_with_scale(tmp_path):
+    # Distances in meters, stored with 10 m resolution
+    path = os.path.join(DATA_DIR, 'travelTimes_2015_Helsinki.txt')
+    table = pd.read_csv(path, sep=';')
+    matrix = open_matrix([path], str(tmp_path), value='route_distance', scale=10)
+    values = matrix.lookup(table['from_id'].to_numpy(), table['to_id'].to_numpy())
+    distance = table['route_distance'].to_numpy()
+    expected = np.where(distance >= 0, np.round(distance / 10) * 10, np.nan)
+    np.testing.assert_array_equal(values, expected)
+
+
+def test_rebuild_after_source_changes(tmp_path):
+    paths = _write([_frame(TO_IDS[0], 0)], str(tmp_path))
+    matrix_dir = str(tmp_path / 'matrix')
+    matrix = open_matrix(paths, matrix_dir)
+    written = os.stat(os.path.join(matrix_dir, 'meta.json')).st_mtime_ns
+    # Same files, the matrix is reused
+    open_matrix(paths, matrix_dir)
+    assert os.stat(os.path.join(matrix_dir, 'meta.json')).st_mtime_ns == written
+
+    frame = _frame(TO_IDS[0], 0)
+    frame['pt_r_tt'] = 99
+    _write([frame], str(tmp_path))
+    matrix = open_matrix(paths, matrix_dir)
+    assert np.all(matrix.to_cell(TO_IDS[0]).dropna() == 99)